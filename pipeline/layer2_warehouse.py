@@ -2,8 +2,10 @@
 # Creates Facts and Dimensions from staging data using SQL transformations
 
 import pandas as pd
+import numpy as np
 import sqlite3
 import logging
+from dataclasses import dataclass
 from datetime import datetime
 import sys
 import os
@@ -12,6 +14,30 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from pipeline_orchestrator import DataPipelineOrchestrator, DataQualityChecker
 
+# Categorical dimension attributes are stored as integer codes (1, 2, ... in list order);
+# their labels are kept once in dim_code_lookup and joined back where they are presented
+CODE_LOOKUP = {
+    'customer_segment': [
+        'VIP Active', 'VIP At Risk', 'Regular Active', 'Regular At Risk',
+        'One-Time Buyer', 'Low Value Active', 'Low Value Inactive'
+    ],
+    'customer_status': ['Active', 'At Risk', 'Inactive'],
+    'order_amount_quartile': ['Low', 'Medium-Low', 'Medium-High', 'High']
+}
+
+@dataclass(frozen=True, slots=True)
+class WarehouseSummary:
+    """Row counts and headline business metrics of the warehouse layer"""
+    dim_date_rows: int
+    dim_customer_rows: int
+    dim_order_rows: int
+    fact_sales_rows: int
+    unique_customers: int
+    total_transactions: int
+    total_revenue: float
+    avg_transaction_value: float
+
+
 class WarehouseLayer:
     """
     Layer 2: Data Warehouse Layer
@@ -27,13 +53,58 @@ class WarehouseLayer:
         self.dq_checker = DataQualityChecker(orchestrator)
         self.logger = orchestrator.logger
         
+        # Warehouse tables are fully rebuilt from staging on every run, so trade durability
+        # for bulk write speed (the business layer attaches warehouse.db, hence WAL)
+        self.warehouse_conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=OFF;
+            PRAGMA temp_store=MEMORY;
+            PRAGMA cache_size=-200000;
+            PRAGMA mmap_size=1073741824;
+        """)
+        
         # Attach staging database to warehouse connection for cross-database queries
         staging_db_path = f'{orchestrator.base_path}/staging.db'
         self.warehouse_conn.execute(f"ATTACH DATABASE '{staging_db_path}' AS staging")
         
+        # Every build scans the staging table; memory-map it (up to 1 GB) so those reads
+        # come straight from the page cache instead of being copied through read()
+        self.warehouse_conn.execute("PRAGMA staging.mmap_size=1073741824")
+        
+        # Valid staging rows, read once per run and shared by the builders
+        self._staging_df = None
+        
+    def _load_staging(self) -> pd.DataFrame:
+        """Return the valid rows of stg_sales_cleaned, reading them on first use"""
+        
+        if self._staging_df is None:
+            self._staging_df = pd.read_sql("""
+                SELECT customer_id, order_id, date_parsed, sales_amount
+                FROM staging.stg_sales_cleaned 
+                WHERE data_quality_flag = 'VALID'
+            """, self.warehouse_conn)
+        return self._staging_df
+        
+    def _drop_legacy_table(self, table_name: str, legacy_columns: list):
+        """
+        Drop a table still carrying any of the given (column, declared type) pairs from an
+        older layout, so CREATE TABLE IF NOT EXISTS recreates it. Only used for tables that
+        are rebuilt from staging on every run
+        """
+        table_columns = set(self.warehouse_conn.execute(
+            "SELECT name, type FROM pragma_table_info(?)", (table_name,)
+        ).fetchall())
+        if table_columns & set(legacy_columns):
+            self.warehouse_conn.execute(f"DROP TABLE {table_name}")
+            
     def create_warehouse_schema(self):
         """Create warehouse dimension and fact tables"""
         
+        # Older databases stored the coded attributes as TEXT and fact_sales in a wider layout
+        self._drop_legacy_table('dim_customer', [('customer_segment', 'TEXT'), ('customer_status', 'TEXT')])
+        self._drop_legacy_table('dim_order', [('order_amount_quartile', 'TEXT')])
+        self._drop_legacy_table('fact_sales', [('transaction_count', 'INTEGER'), ('created_at', 'TIMESTAMP')])
+        
         # Date Dimension
         self.warehouse_conn.execute("""
             CREATE TABLE IF NOT EXISTS dim_date (
@@ -80,8 +151,8 @@ class WarehouseLayer:
                 days_since_first_order INTEGER,
                 customer_vintage_group TEXT,
                 days_since_last_order INTEGER,
-                customer_segment TEXT,
-                customer_status TEXT,
+                customer_segment INTEGER,
+                customer_status INTEGER,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
@@ -105,25 +176,46 @@ class WarehouseLayer:
                 is_first_order INTEGER,
                 days_since_customer_first_order INTEGER,
                 days_since_previous_order INTEGER,
-                order_amount_quartile TEXT,
+                order_amount_quartile INTEGER,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
         
-        # Sales Fact Table
+        # Sales Fact Table: one row per valid staging row. There is no declared key, so an
+        # order_id repeated in the source keeps every row (and is reported by the DQ checks)
         self.warehouse_conn.execute("""
             CREATE TABLE IF NOT EXISTS fact_sales (
-                customer_id INTEGER,
-                order_id INTEGER,
-                date_id INTEGER,
-                sales_amount REAL,
-                transaction_count INTEGER DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (customer_id, order_id, date_id)
+                customer_id INTEGER NOT NULL,
+                order_id INTEGER NOT NULL,
+                date_id INTEGER NOT NULL,
+                sales_amount REAL NOT NULL
+            )
+        """)
+        
+        # Covering indexes for the business layer's joins and cohort grouping
+        self.warehouse_conn.execute("CREATE INDEX IF NOT EXISTS idx_dim_date_year_month ON dim_date(date_id, year, month)")
+        self.warehouse_conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_dim_customer_cohort ON dim_customer(first_order_cohort_month, customer_id)"
+        )
+        
+        # Code Lookup: labels for the integer coded dimension attributes
+        self.warehouse_conn.execute("""
+            CREATE TABLE IF NOT EXISTS dim_code_lookup (
+                code_type TEXT,
+                code INTEGER,
+                label TEXT,
+                PRIMARY KEY (code_type, code),
+                UNIQUE (code_type, label)
             )
         """)
+        self.warehouse_conn.executemany("""
+            INSERT OR REPLACE INTO dim_code_lookup (code_type, code, label) VALUES (?, ?, ?)
+        """, [
+            (code_type, code, label)
+            for code_type, labels in CODE_LOOKUP.items()
+            for code, label in enumerate(labels, start=1)
+        ])
         
-        self.warehouse_conn.commit()
         self.logger.info("Data warehouse schema created successfully")
         
     def build_date_dimension(self) -> str:
@@ -132,77 +224,59 @@ class WarehouseLayer:
         run_id = self.orchestrator.log_pipeline_run('WAREHOUSE', 'dim_date', 'STARTED')
         
         try:
-            # Get date range from staging data
-            cursor = self.warehouse_conn.execute("""
-                SELECT MIN(date_parsed), MAX(date_parsed) 
-                FROM staging.stg_sales_cleaned 
-                WHERE data_quality_flag = 'VALID'
-            """)
-            min_date, max_date = cursor.fetchone()
+            # Full refresh: clear the table in the same transaction as the load, so dates that
+            # left staging don't linger
+            self.warehouse_conn.execute("BEGIN IMMEDIATE")
+            self.warehouse_conn.execute("DELETE FROM dim_date")
             
-            # Creating date dimension
-            self.warehouse_conn.execute("""
-                INSERT OR REPLACE INTO dim_date 
-                (date_id, full_date, year, quarter, month, month_name, month_abbr,
-                 week_of_year, day_of_year, day_of_month, day_of_week, day_name, day_abbr,
-                 is_weekend, is_month_start, is_month_end, is_quarter_start, is_quarter_end,
-                 is_year_start, is_year_end, date_string, month_year, quarter_year)
-                SELECT DISTINCT
-                    CAST(REPLACE(date_parsed, '-', '') AS INTEGER) as date_id,
-                    date_parsed as full_date,
-                    CAST(strftime('%Y', date_parsed) AS INTEGER) as year,
-                    CASE 
-                        WHEN CAST(strftime('%m', date_parsed) AS INTEGER) BETWEEN 1 AND 3 THEN 1
-                        WHEN CAST(strftime('%m', date_parsed) AS INTEGER) BETWEEN 4 AND 6 THEN 2
-                        WHEN CAST(strftime('%m', date_parsed) AS INTEGER) BETWEEN 7 AND 9 THEN 3
-                        ELSE 4
-                    END as quarter,
-                    CAST(strftime('%m', date_parsed) AS INTEGER) as month,
-                    CASE strftime('%m', date_parsed)
-                        WHEN '01' THEN 'January' WHEN '02' THEN 'February'
-                        WHEN '03' THEN 'March' WHEN '04' THEN 'April'
-                        WHEN '05' THEN 'May' WHEN '06' THEN 'June'
-                        WHEN '07' THEN 'July' WHEN '08' THEN 'August'
-                        WHEN '09' THEN 'September' WHEN '10' THEN 'October'
-                        WHEN '11' THEN 'November' WHEN '12' THEN 'December'
-                    END as month_name,
-                    CASE strftime('%m', date_parsed)
-                        WHEN '01' THEN 'Jan' WHEN '02' THEN 'Feb'
-                        WHEN '03' THEN 'Mar' WHEN '04' THEN 'Apr'
-                        WHEN '05' THEN 'May' WHEN '06' THEN 'Jun'
-                        WHEN '07' THEN 'Jul' WHEN '08' THEN 'Aug'
-                        WHEN '09' THEN 'Sep' WHEN '10' THEN 'Oct'
-                        WHEN '11' THEN 'Nov' WHEN '12' THEN 'Dec'
-                    END as month_abbr,
-                    CAST(strftime('%W', date_parsed) AS INTEGER) as week_of_year,
-                    CAST(strftime('%j', date_parsed) AS INTEGER) as day_of_year,
-                    CAST(strftime('%d', date_parsed) AS INTEGER) as day_of_month,
-                    CAST(strftime('%w', date_parsed) AS INTEGER) + 1 as day_of_week,
-                    strftime('%A', date_parsed) as day_name,
-                    CASE strftime('%w', date_parsed)
-                        WHEN '0' THEN 'Sun' WHEN '1' THEN 'Mon' WHEN '2' THEN 'Tue'
-                        WHEN '3' THEN 'Wed' WHEN '4' THEN 'Thu' WHEN '5' THEN 'Fri'
-                        WHEN '6' THEN 'Sat'
-                    END as day_abbr,
-                    CASE WHEN strftime('%w', date_parsed) IN ('0', '6') THEN 1 ELSE 0 END as is_weekend,
-                    CASE WHEN strftime('%d', date_parsed) = '01' THEN 1 ELSE 0 END as is_month_start,
-                    CASE WHEN date_parsed = date(date_parsed, 'start of month', '+1 month', '-1 day') THEN 1 ELSE 0 END as is_month_end,
-                    CASE WHEN strftime('%m-%d', date_parsed) IN ('01-01', '04-01', '07-01', '10-01') THEN 1 ELSE 0 END as is_quarter_start,
-                    CASE WHEN strftime('%m-%d', date_parsed) IN ('03-31', '06-30', '09-30', '12-31') THEN 1 ELSE 0 END as is_quarter_end,
-                    CASE WHEN strftime('%m-%d', date_parsed) = '01-01' THEN 1 ELSE 0 END as is_year_start,
-                    CASE WHEN strftime('%m-%d', date_parsed) = '12-31' THEN 1 ELSE 0 END as is_year_end,
-                    date_parsed as date_string,
-                    strftime('%b %Y', date_parsed) as month_year,
-                    'Q' || CASE 
-                        WHEN CAST(strftime('%m', date_parsed) AS INTEGER) BETWEEN 1 AND 3 THEN '1'
-                        WHEN CAST(strftime('%m', date_parsed) AS INTEGER) BETWEEN 4 AND 6 THEN '2'
-                        WHEN CAST(strftime('%m', date_parsed) AS INTEGER) BETWEEN 7 AND 9 THEN '3'
-                        ELSE '4'
-                    END as quarter_year
-                FROM staging.stg_sales_cleaned 
-                WHERE data_quality_flag = 'VALID'
-                ORDER BY date_parsed
-            """)
+            # Get date range from staging data
+            staging = self._load_staging()
+            
+            # Creating date dimension: one row per calendar day in the range, with the date
+            # parts computed column-wise in pandas instead of per row with SQLite strftime()
+            if not staging.empty:
+                dates = pd.date_range(staging['date_parsed'].min(), staging['date_parsed'].max(), freq='D')
+                month_name = dates.month_name()
+                day_name = dates.day_name()
+                month_day = dates.strftime('%m-%d')
+                
+                dim_date = pd.DataFrame({
+                    'date_id': dates.year * 10000 + dates.month * 100 + dates.day,
+                    'full_date': dates.strftime('%Y-%m-%d'),
+                    'year': dates.year,
+                    'quarter': dates.quarter,
+                    'month': dates.month,
+                    'month_name': month_name,
+                    'month_abbr': month_name.str[:3],
+                    'week_of_year': dates.strftime('%W').astype(int),
+                    'day_of_year': dates.dayofyear,
+                    'day_of_month': dates.day,
+                    # Sunday = 1 ... Saturday = 7, as with strftime('%w') + 1
+                    'day_of_week': (dates.dayofweek + 1) % 7 + 1,
+                    'day_name': day_name,
+                    'day_abbr': day_name.str[:3],
+                    'is_weekend': (dates.dayofweek >= 5).astype(int),
+                    'is_month_start': dates.is_month_start.astype(int),
+                    'is_month_end': dates.is_month_end.astype(int),
+                    'is_quarter_start': month_day.isin(['01-01', '04-01', '07-01', '10-01']).astype(int),
+                    'is_quarter_end': month_day.isin(['03-31', '06-30', '09-30', '12-31']).astype(int),
+                    'is_year_start': dates.is_year_start.astype(int),
+                    'is_year_end': dates.is_year_end.astype(int),
+                    'date_string': dates.strftime('%Y-%m-%d'),
+                    'month_year': month_name.str[:3] + ' ' + dates.year.astype(str),
+                    'quarter_year': 'Q' + dates.quarter.astype(str)
+                })
+                
+                self.warehouse_conn.executemany("""
+                    INSERT INTO dim_date 
+                    (date_id, full_date, year, quarter, month, month_name, month_abbr,
+                     week_of_year, day_of_year, day_of_month, day_of_week, day_name, day_abbr,
+                     is_weekend, is_month_start, is_month_end, is_quarter_start, is_quarter_end,
+                     is_year_start, is_year_end, date_string, month_year, quarter_year)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, dim_date.itertuples(index=False, name=None))
+                
+            self.warehouse_conn.execute("COMMIT")
             
             # Get row count
             cursor = self.warehouse_conn.execute("SELECT COUNT(*) FROM dim_date")
@@ -213,14 +287,15 @@ class WarehouseLayer:
             # Run data quality checks
             self._run_date_dimension_quality_checks(run_id)
             
-            self.warehouse_conn.commit()
-            self.logger.info(f"Date dimension built successfully with {row_count} rows")
+            self.logger.info("Date dimension built successfully with %s rows", row_count)
             
             return run_id
             
         except Exception as e:
+            if self.warehouse_conn.in_transaction:
+                self.warehouse_conn.execute("ROLLBACK")
             self.orchestrator.log_pipeline_run('WAREHOUSE', 'dim_date', 'FAILED', 0, str(e))
-            self.logger.error(f"Failed to build date dimension: {str(e)}")
+            self.logger.error("Failed to build date dimension: %s", e)
             raise
             
     def build_customer_dimension(self) -> str:
@@ -229,15 +304,18 @@ class WarehouseLayer:
         run_id = self.orchestrator.log_pipeline_run('WAREHOUSE', 'dim_customer', 'STARTED')
         
         try:
-            # Build customer dimension from staging data
+            # Build customer dimension from staging data (full refresh: cleared and reloaded
+            # in one transaction; GROUP BY customer_id makes every key unique)
+            self.warehouse_conn.execute("BEGIN IMMEDIATE")
+            self.warehouse_conn.execute("DELETE FROM dim_customer")
             self.warehouse_conn.execute("""
-                INSERT OR REPLACE INTO dim_customer (
+                INSERT INTO dim_customer (
                     customer_id, first_order_date, last_order_date, total_transactions,
                     total_spent, avg_order_value, total_orders, first_order_cohort_month,
                     first_order_cohort_quarter, first_order_cohort_year, days_since_first_order,
                     customer_vintage_group, days_since_last_order, customer_segment, customer_status
                 )
-                WITH customer_metrics AS (
+                WITH customer_orders AS (
                     SELECT 
                         customer_id,
                         MIN(date_parsed) as first_order_date,
@@ -245,24 +323,37 @@ class WarehouseLayer:
                         COUNT(*) as total_transactions,
                         SUM(sales_amount) as total_spent,
                         AVG(sales_amount) as avg_order_value,
-                        COUNT(DISTINCT order_id) as total_orders,
-                        strftime('%Y-%m', MIN(date_parsed)) as first_order_cohort_month,
-                        strftime('%Y', MIN(date_parsed)) || '-Q' || 
-                        CASE 
-                            WHEN CAST(strftime('%m', MIN(date_parsed)) AS INTEGER) BETWEEN 1 AND 3 THEN '1'
-                            WHEN CAST(strftime('%m', MIN(date_parsed)) AS INTEGER) BETWEEN 4 AND 6 THEN '2'
-                            WHEN CAST(strftime('%m', MIN(date_parsed)) AS INTEGER) BETWEEN 7 AND 9 THEN '3'
-                            ELSE '4'
-                        END as first_order_cohort_quarter,
-                        CAST(strftime('%Y', MIN(date_parsed)) AS INTEGER) as first_order_cohort_year,
-                        julianday('now') - julianday(MIN(date_parsed)) as days_since_first_order,
-                        julianday('now') - julianday(MAX(date_parsed)) as days_since_last_order
+                        COUNT(DISTINCT order_id) as total_orders
                     FROM staging.stg_sales_cleaned 
                     WHERE data_quality_flag = 'VALID'
                     GROUP BY customer_id
                 ),
+                customer_metrics AS (
+                    -- Cohort fields derived from the already aggregated first order date
+                    SELECT 
+                        customer_id,
+                        first_order_date,
+                        last_order_date,
+                        total_transactions,
+                        total_spent,
+                        avg_order_value,
+                        total_orders,
+                        strftime('%Y-%m', first_order_date) as first_order_cohort_month,
+                        strftime('%Y', first_order_date) || '-Q' || 
+                            ((CAST(strftime('%m', first_order_date) AS INTEGER) + 2) / 3) as first_order_cohort_quarter,
+                        CAST(strftime('%Y', first_order_date) AS INTEGER) as first_order_cohort_year,
+                        julianday('now') - julianday(first_order_date) as days_since_first_order,
+                        julianday('now') - julianday(last_order_date) as days_since_last_order
+                    FROM customer_orders
+                ),
+                -- Segment thresholds computed once and broadcast to every customer
+                spend_thresholds AS (
+                    SELECT 
+                        (SELECT total_spent FROM customer_metrics ORDER BY total_spent DESC LIMIT 1 OFFSET CAST((SELECT COUNT(*) FROM customer_metrics) * 0.8 AS INTEGER)) as vip_threshold,
+                        (SELECT AVG(total_spent) FROM customer_metrics) as avg_spent
+                ),
                 customer_enriched AS (
-                    SELECT *,
+                    SELECT cm.*,
                         CASE 
                             WHEN days_since_first_order <= 30 THEN '0-30 days'
                             WHEN days_since_first_order <= 90 THEN '31-90 days'
@@ -270,10 +361,11 @@ class WarehouseLayer:
                             WHEN days_since_first_order <= 365 THEN '181-365 days'
                             ELSE '365+ days'
                         END as customer_vintage_group,
+                        (SELECT code FROM dim_code_lookup WHERE code_type = 'customer_segment' AND label =
                         CASE 
-                            WHEN total_spent >= (SELECT total_spent FROM customer_metrics ORDER BY total_spent DESC LIMIT 1 OFFSET CAST((SELECT COUNT(*) FROM customer_metrics) * 0.8 AS INTEGER)) THEN
+                            WHEN total_spent >= t.vip_threshold THEN
                                 CASE WHEN days_since_last_order <= 30 THEN 'VIP Active' ELSE 'VIP At Risk' END
-                            WHEN total_spent >= (SELECT AVG(total_spent) FROM customer_metrics) THEN
+                            WHEN total_spent >= t.avg_spent THEN
                                 CASE WHEN days_since_last_order <= 60 THEN 'Regular Active' ELSE 'Regular At Risk' END
                             ELSE
                                 CASE 
@@ -281,16 +373,19 @@ class WarehouseLayer:
                                     WHEN days_since_last_order <= 90 THEN 'Low Value Active'
                                     ELSE 'Low Value Inactive'
                                 END
-                        END as customer_segment,
+                        END) as customer_segment,
+                        (SELECT code FROM dim_code_lookup WHERE code_type = 'customer_status' AND label =
                         CASE 
                             WHEN days_since_last_order <= 30 THEN 'Active'
                             WHEN days_since_last_order <= 90 THEN 'At Risk'
                             ELSE 'Inactive'
-                        END as customer_status
-                    FROM customer_metrics
+                        END) as customer_status
+                    FROM customer_metrics cm
+                    CROSS JOIN spend_thresholds t
                 )
                 SELECT * FROM customer_enriched
             """)
+            self.warehouse_conn.execute("COMMIT")
             
             # Get row count
             cursor = self.warehouse_conn.execute("SELECT COUNT(*) FROM dim_customer")
@@ -301,14 +396,15 @@ class WarehouseLayer:
             # Run data quality checks
             self._run_customer_dimension_quality_checks(run_id)
             
-            self.warehouse_conn.commit()
-            self.logger.info(f"Customer dimension built successfully with {row_count} rows")
+            self.logger.info("Customer dimension built successfully with %s rows", row_count)
             
             return run_id
             
         except Exception as e:
+            if self.warehouse_conn.in_transaction:
+                self.warehouse_conn.execute("ROLLBACK")
             self.orchestrator.log_pipeline_run('WAREHOUSE', 'dim_customer', 'FAILED', 0, str(e))
-            self.logger.error(f"Failed to build customer dimension: {str(e)}")
+            self.logger.error("Failed to build customer dimension: %s", e)
             raise
             
     def build_order_dimension(self) -> str:
@@ -317,8 +413,54 @@ class WarehouseLayer:
         run_id = self.orchestrator.log_pipeline_run('WAREHOUSE', 'dim_order', 'STARTED')
         
         try:
-            # Build order dimension from staging data
-            self.warehouse_conn.execute("""
+            # Build order dimension from staging data. The per-customer sequence, previous
+            # order and amount quartile come from one sort in pandas rather than three
+            # window sorts in SQLite
+            orders = self._load_staging().sort_values(['customer_id', 'date_parsed', 'order_id'], kind='stable')
+            
+            order_dates = pd.to_datetime(orders['date_parsed'])
+            by_customer = order_dates.groupby(orders['customer_id'], sort=False)
+            order_sequence = by_customer.cumcount() + 1
+            
+            # NTILE(4) over the order amount: the first len % 4 buckets take one extra row
+            order_count = len(orders)
+            bucket_size, extra = divmod(order_count, 4)
+            amount_rank = np.empty(order_count, dtype=np.int64)
+            amount_rank[np.argsort(orders['sales_amount'].to_numpy(), kind='stable')] = np.arange(order_count)
+            large_rows = extra * (bucket_size + 1)
+            amount_quartile = np.where(
+                amount_rank < large_rows,
+                amount_rank // (bucket_size + 1),
+                extra + (amount_rank - large_rows) // max(bucket_size, 1)
+            )
+            
+            dim_order = pd.DataFrame({
+                'order_id': orders['order_id'],
+                'customer_id': orders['customer_id'],
+                'order_date': orders['date_parsed'],
+                'date_id': order_dates.dt.year * 10000 + order_dates.dt.month * 100 + order_dates.dt.day,
+                'order_amount': orders['sales_amount'],
+                'order_year': order_dates.dt.year,
+                'order_month': order_dates.dt.month,
+                'order_quarter': order_dates.dt.quarter,
+                # Sunday = 1 ... Saturday = 7, matching dim_date.day_of_week
+                'order_day_of_week': (order_dates.dt.dayofweek + 1) % 7 + 1,
+                'order_day_name': order_dates.dt.day_name(),
+                'is_weekend_order': (order_dates.dt.dayofweek >= 5).astype(int),
+                'customer_order_sequence': order_sequence,
+                'is_first_order': (order_sequence == 1).astype(int),
+                'days_since_customer_first_order': (order_dates - by_customer.transform('min')).dt.days,
+                'days_since_previous_order': (order_dates - by_customer.shift()).dt.days,
+                'order_amount_quartile': amount_quartile + 1
+            })
+            
+            # Full refresh in one transaction. order_id isn't unique by construction in staging,
+            # so a repeated order still replaces the earlier row instead of failing the load.
+            # The per-customer sequence index is rebuilt after the load, as for fact_sales
+            self.warehouse_conn.execute("BEGIN IMMEDIATE")
+            self.warehouse_conn.execute("DROP INDEX IF EXISTS idx_dim_order_customer_sequence")
+            self.warehouse_conn.execute("DELETE FROM dim_order")
+            self.warehouse_conn.executemany("""
                 INSERT OR REPLACE INTO dim_order (
                     order_id, customer_id, order_date, date_id, order_amount,
                     order_year, order_month, order_quarter, order_day_of_week,
@@ -326,66 +468,13 @@ class WarehouseLayer:
                     is_first_order, days_since_customer_first_order, 
                     days_since_previous_order, order_amount_quartile
                 )
-                WITH order_sequence AS (
-                    SELECT 
-                        order_id,
-                        customer_id,
-                        date_parsed as order_date,
-                        CAST(REPLACE(strftime('%Y-%m-%d', date_parsed), '-', '') AS INTEGER) as date_id,
-                        sales_amount as order_amount,
-                        CAST(strftime('%Y', date_parsed) AS INTEGER) as order_year,
-                        CAST(strftime('%m', date_parsed) AS INTEGER) as order_month,
-                        CASE 
-                            WHEN CAST(strftime('%m', date_parsed) AS INTEGER) BETWEEN 1 AND 3 THEN 1
-                            WHEN CAST(strftime('%m', date_parsed) AS INTEGER) BETWEEN 4 AND 6 THEN 2
-                            WHEN CAST(strftime('%m', date_parsed) AS INTEGER) BETWEEN 7 AND 9 THEN 3
-                            ELSE 4
-                        END as order_quarter,
-                        CAST(strftime('%w', date_parsed) AS INTEGER) + 1 as order_day_of_week,
-                        strftime('%A', date_parsed) as order_day_name,
-                        CASE WHEN strftime('%w', date_parsed) IN ('0', '6') THEN 1 ELSE 0 END as is_weekend_order,
-                        ROW_NUMBER() OVER (PARTITION BY customer_id ORDER BY date_parsed, order_id) as customer_order_sequence,
-                        LAG(date_parsed) OVER (PARTITION BY customer_id ORDER BY date_parsed, order_id) as prev_order_date
-                    FROM staging.stg_sales_cleaned 
-                    WHERE data_quality_flag = 'VALID'
-                ),
-                customer_first_orders AS (
-                    SELECT customer_id, MIN(order_date) as first_order_date
-                    FROM order_sequence
-                    GROUP BY customer_id
-                ),
-                orders_enriched AS (
-                    SELECT 
-                        o.*,
-                        CASE WHEN o.customer_order_sequence = 1 THEN 1 ELSE 0 END as is_first_order,
-                        julianday(o.order_date) - julianday(cfo.first_order_date) as days_since_customer_first_order,
-                        CASE 
-                            WHEN o.prev_order_date IS NOT NULL 
-                            THEN julianday(o.order_date) - julianday(o.prev_order_date)
-                            ELSE NULL 
-                        END as days_since_previous_order,
-                        NTILE(4) OVER (ORDER BY o.order_amount) as amount_quartile
-                    FROM order_sequence o
-                    JOIN customer_first_orders cfo ON o.customer_id = cfo.customer_id
-                ),
-                final_orders AS (
-                    SELECT *,
-                        CASE amount_quartile
-                            WHEN 1 THEN 'Low'
-                            WHEN 2 THEN 'Medium-Low'
-                            WHEN 3 THEN 'Medium-High'
-                            WHEN 4 THEN 'High'
-                        END as order_amount_quartile
-                    FROM orders_enriched
-                )
-                SELECT 
-                    order_id, customer_id, order_date, date_id, order_amount,
-                    order_year, order_month, order_quarter, order_day_of_week,
-                    order_day_name, is_weekend_order, customer_order_sequence,
-                    is_first_order, days_since_customer_first_order,
-                    days_since_previous_order, order_amount_quartile
-                FROM final_orders
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, dim_order.itertuples(index=False, name=None))
+            self.warehouse_conn.execute("""
+                CREATE INDEX idx_dim_order_customer_sequence
+                ON dim_order(customer_id, customer_order_sequence, days_since_customer_first_order)
             """)
+            self.warehouse_conn.execute("COMMIT")
             
             # Get row count
             cursor = self.warehouse_conn.execute("SELECT COUNT(*) FROM dim_order")
@@ -396,14 +485,15 @@ class WarehouseLayer:
             # Run data quality checks
             self._run_order_dimension_quality_checks(run_id)
             
-            self.warehouse_conn.commit()
-            self.logger.info(f"Order dimension built successfully with {row_count} rows")
+            self.logger.info("Order dimension built successfully with %s rows", row_count)
             
             return run_id
             
         except Exception as e:
+            if self.warehouse_conn.in_transaction:
+                self.warehouse_conn.execute("ROLLBACK")
             self.orchestrator.log_pipeline_run('WAREHOUSE', 'dim_order', 'FAILED', 0, str(e))
-            self.logger.error(f"Failed to build order dimension: {str(e)}")
+            self.logger.error("Failed to build order dimension: %s", e)
             raise
             
     def build_sales_fact(self) -> str:
@@ -412,21 +502,35 @@ class WarehouseLayer:
         run_id = self.orchestrator.log_pipeline_run('WAREHOUSE', 'fact_sales', 'STARTED')
         
         try:
-            # Build fact table from staging data
+            # Build fact table from staging data as a full refresh; the secondary indexes are
+            # dropped for the load and rebuilt in a single pass afterwards. Row order in the
+            # table is irrelevant.
+            # date_parsed is already an ISO date, so date_id (YYYYMMDD, as in dim_date) is
+            # assembled from its fixed-width parts without reformatting it through strftime()
+            self.warehouse_conn.execute("BEGIN IMMEDIATE")
+            self.warehouse_conn.execute("DROP INDEX IF EXISTS idx_fact_sales_date")
+            self.warehouse_conn.execute("DROP INDEX IF EXISTS idx_fact_sales_customer")
+            self.warehouse_conn.execute("DELETE FROM fact_sales")
             self.warehouse_conn.execute("""
-                INSERT OR REPLACE INTO fact_sales (
-                    customer_id, order_id, date_id, sales_amount, transaction_count
+                INSERT INTO fact_sales (
+                    customer_id, order_id, date_id, sales_amount
                 )
                 SELECT 
                     customer_id,
                     order_id,
-                    CAST(REPLACE(strftime('%Y-%m-%d', date_parsed), '-', '') AS INTEGER) as date_id,
-                    sales_amount,
-                    1 as transaction_count
+                    CAST(substr(date_parsed, 1, 4) AS INTEGER) * 10000
+                        + CAST(substr(date_parsed, 6, 2) AS INTEGER) * 100
+                        + CAST(substr(date_parsed, 9, 2) AS INTEGER) as date_id,
+                    sales_amount
                 FROM staging.stg_sales_cleaned 
                 WHERE data_quality_flag = 'VALID'
-                ORDER BY date_parsed, customer_id, order_id
             """)
+            # The date index also carries the measures so date-driven joins never touch the table
+            self.warehouse_conn.execute(
+                "CREATE INDEX idx_fact_sales_date ON fact_sales(date_id, customer_id, order_id, sales_amount)"
+            )
+            self.warehouse_conn.execute("CREATE INDEX idx_fact_sales_customer ON fact_sales(customer_id)")
+            self.warehouse_conn.execute("COMMIT")
             
             # Get row count
             cursor = self.warehouse_conn.execute("SELECT COUNT(*) FROM fact_sales")
@@ -437,30 +541,28 @@ class WarehouseLayer:
             # Run data quality checks
             self._run_sales_fact_quality_checks(run_id)
             
-            self.warehouse_conn.commit()
-            self.logger.info(f"Sales fact table built successfully with {row_count} rows")
+            self.logger.info("Sales fact table built successfully with %s rows", row_count)
             
             return run_id
             
         except Exception as e:
+            if self.warehouse_conn.in_transaction:
+                self.warehouse_conn.execute("ROLLBACK")
             self.orchestrator.log_pipeline_run('WAREHOUSE', 'fact_sales', 'FAILED', 0, str(e))
-            self.logger.error(f"Failed to build sales fact table: {str(e)}")
+            self.logger.error("Failed to build sales fact table: %s", e)
             raise
             
     def _run_date_dimension_quality_checks(self, run_id: str):
         """Run data quality checks on date dimension"""
         
-        # Check for no gaps in date sequence
+        # Check for no gaps in date sequence: a contiguous calendar has exactly one row per
+        # day between its first and last date, so the shortfall is the number of missing days
         try:
             cursor = self.warehouse_conn.execute("""
-                WITH date_gaps AS (
-                    SELECT 
-                        full_date,
-                        LAG(full_date) OVER (ORDER BY full_date) as prev_date,
-                        julianday(full_date) - julianday(LAG(full_date) OVER (ORDER BY full_date)) as day_diff
-                    FROM dim_date
-                )
-                SELECT COUNT(*) FROM date_gaps WHERE day_diff > 1
+                SELECT COALESCE(
+                    CAST(julianday(MAX(full_date)) - julianday(MIN(full_date)) + 1 AS INTEGER) - COUNT(*), 0
+                ) as gap_count
+                FROM dim_date
             """)
             gap_count = cursor.fetchone()[0]
             
@@ -485,20 +587,12 @@ class WarehouseLayer:
     def _run_customer_dimension_quality_checks(self, run_id: str):
         """Run data quality checks on customer dimension"""
         
-        # Check no null customer IDs
-        self.dq_checker.check_null_percentage(
-            self.warehouse_conn, 'dim_customer', 'customer_id', max_null_pct=0.0, run_id=run_id
-        )
-        
-        # Check all customers have first order date
-        self.dq_checker.check_null_percentage(
-            self.warehouse_conn, 'dim_customer', 'first_order_date', max_null_pct=0.0, run_id=run_id
-        )
-        
-        # Check customer segments are assigned
-        self.dq_checker.check_null_percentage(
-            self.warehouse_conn, 'dim_customer', 'customer_segment', max_null_pct=0.0, run_id=run_id
-        )
+        # Check no null customer IDs, that all customers have a first order date and that
+        # customer segments are assigned; one statement and one scan for all three
+        self.dq_checker.check_batch(self.warehouse_conn, 'dim_customer', [
+            ('NULL_CHECK', column, 0.0)
+            for column in ['customer_id', 'first_order_date', 'customer_segment']
+        ], run_id=run_id)
         
     def _run_order_dimension_quality_checks(self, run_id: str):
         """Run data quality checks on order dimension"""
@@ -553,13 +647,37 @@ class WarehouseLayer:
                 "0", "ERROR", "FAILED", str(e)
             )
             
+        # Check each order appears once: dim_order keeps a single row per order_id, so any
+        # repeated order in the fact table no longer matches its dimension row
+        try:
+            cursor = self.warehouse_conn.execute("""
+                SELECT COUNT(*) FROM (
+                    SELECT order_id FROM fact_sales GROUP BY order_id HAVING COUNT(*) > 1
+                )
+            """)
+            duplicate_orders = cursor.fetchone()[0]
+            
+            status = "PASSED" if duplicate_orders == 0 else "FAILED"
+            
+            self.orchestrator.log_data_quality_check(
+                run_id, 'fact_sales', 'UNIQUENESS', 'duplicate_order_check',
+                "0", str(duplicate_orders), status
+            )
+            
+        except Exception as e:
+            self.orchestrator.log_data_quality_check(
+                run_id, 'fact_sales', 'UNIQUENESS', 'duplicate_order_check',
+                "0", "ERROR", "FAILED", str(e)
+            )
+            
         # Check referential integrity with dimensions
         try:
             cursor = self.warehouse_conn.execute("""
                 SELECT COUNT(*) 
                 FROM fact_sales f
-                LEFT JOIN dim_customer c ON f.customer_id = c.customer_id
-                WHERE c.customer_id IS NULL
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM dim_customer c WHERE c.customer_id = f.customer_id
+                )
             """)
             orphaned_customers = cursor.fetchone()[0]
             
@@ -576,35 +694,27 @@ class WarehouseLayer:
                 "0", "ERROR", "FAILED", str(e)
             )
             
-    def get_warehouse_summary(self) -> dict:
+    def get_warehouse_summary(self) -> WarehouseSummary:
         """Get summary of warehouse layer data"""
         
-        summary = {}
-        
-        # Table row counts
-        tables = ['dim_date', 'dim_customer', 'dim_order', 'fact_sales']
-        for table in tables:
-            cursor = self.warehouse_conn.execute(f"SELECT COUNT(*) FROM {table}")
-            summary[f'{table}_rows'] = cursor.fetchone()[0]
-            
-        # Business metrics
+        # Table row counts and business metrics in a single round trip
         cursor = self.warehouse_conn.execute("""
             SELECT 
+                (SELECT COUNT(*) FROM dim_date) as dim_date_rows,
+                (SELECT COUNT(*) FROM dim_customer) as dim_customer_rows,
+                (SELECT COUNT(*) FROM dim_order) as dim_order_rows,
+                (SELECT COUNT(*) FROM fact_sales) as fact_sales_rows,
                 COUNT(DISTINCT customer_id) as unique_customers,
                 COUNT(*) as total_transactions,
                 SUM(sales_amount) as total_revenue,
                 AVG(sales_amount) as avg_transaction_value
             FROM fact_sales
         """)
-        metrics = cursor.fetchone()
-        summary.update({
-            'unique_customers': metrics[0],
-            'total_transactions': metrics[1], 
-            'total_revenue': round(metrics[2], 2),
-            'avg_transaction_value': round(metrics[3], 2)
-        })
-        
-        return summary
+        summary = dict(zip([column[0] for column in cursor.description], cursor.fetchone()))
+        summary['total_revenue'] = round(summary['total_revenue'], 2)
+        summary['avg_transaction_value'] = round(summary['avg_transaction_value'], 2)
+        
+        return WarehouseSummary(**summary)
 
 
 def run_warehouse_pipeline(orchestrator=None):
@@ -634,47 +744,57 @@ def run_warehouse_pipeline(orchestrator=None):
         warehouse.logger.info("Building sales fact table...")
         warehouse.build_sales_fact()
         
+        # Refresh planner statistics so the business layer's queries pick up the covering indexes
+        warehouse.warehouse_conn.execute("ANALYZE main")
+        
         # Get summary
         summary = warehouse.get_warehouse_summary()
-        warehouse.logger.info(f"Warehouse pipeline completed successfully: {summary}")
-        
-        print("WAREHOUSE LAYER SUMMARY:")
-        print("=" * 50)
-        print(f"Date dimension: {summary['dim_date_rows']:,} rows")
-        print(f"Customer dimension: {summary['dim_customer_rows']:,} rows")
-        print(f"Order dimension: {summary['dim_order_rows']:,} rows")
-        print(f"Sales fact: {summary['fact_sales_rows']:,} rows")
-        print(f"\nBusiness Metrics:")
-        print(f"Unique customers: {summary['unique_customers']:,}")
-        print(f"Total transactions: {summary['total_transactions']:,}")
-        print(f"Total revenue: ${summary['total_revenue']:,.2f}")
-        print(f"Avg transaction value: ${summary['avg_transaction_value']:.2f}")
+        warehouse.logger.info("Warehouse pipeline completed successfully: %s", summary)
+        
+        # Summary is written to stdout in one go, and only formatted when the pipeline is
+        # reporting at INFO level (it is skipped along with the log output otherwise)
+        if warehouse.logger.isEnabledFor(logging.INFO):
+            sys.stdout.write("\n".join([
+                "WAREHOUSE LAYER SUMMARY:",
+                "=" * 50,
+                f"Date dimension: {summary.dim_date_rows:,} rows",
+                f"Customer dimension: {summary.dim_customer_rows:,} rows",
+                f"Order dimension: {summary.dim_order_rows:,} rows",
+                f"Sales fact: {summary.fact_sales_rows:,} rows",
+                "\nBusiness Metrics:",
+                f"Unique customers: {summary.unique_customers:,}",
+                f"Total transactions: {summary.total_transactions:,}",
+                f"Total revenue: ${summary.total_revenue:,.2f}",
+                f"Avg transaction value: ${summary.avg_transaction_value:.2f}"
+            ]) + "\n")
+            sys.stdout.flush()
         
         return orchestrator, summary
         
     except Exception as e:
-        orchestrator.logger.error(f"Warehouse pipeline failed: {str(e)}")
+        orchestrator.logger.exception("Warehouse pipeline failed: %s", e)
         raise
+    finally:
+        orchestrator.flush_runs()
 
 
 # Example usage
 if __name__ == "__main__":
-    try:
-        orchestrator, summary = run_warehouse_pipeline()
-        print("\nWarehouse pipeline completed successfully!")
-        
-        # Show pipeline status
-        print("\nPipeline Status:")
-        status_df = orchestrator.get_pipeline_status()
-        print(status_df.to_string(index=False))
-        
-        # Show data quality summary
-        print("\nData Quality Summary:")
-        dq_summary = orchestrator.get_data_quality_summary()
-        print(dq_summary.to_string(index=False))
-        
-    except Exception as e:
-        print(f"Pipeline failed: {str(e)}")
-    finally:
-        if 'orchestrator' in locals():
-            orchestrator.close_connections()
\ No newline at end of file
+    # The orchestrator closes its connections when the block exits, whether or not the run failed
+    with DataPipelineOrchestrator() as orchestrator:
+        try:
+            orchestrator, summary = run_warehouse_pipeline(orchestrator)
+            print("\nWarehouse pipeline completed successfully!")
+            
+            # Show pipeline status
+            print("\nPipeline Status:")
+            status_df = orchestrator.get_pipeline_status()
+            print(status_df.to_string(index=False))
+            
+            # Show data quality summary
+            print("\nData Quality Summary:")
+            dq_summary = orchestrator.get_data_quality_summary()
+            print(dq_summary.to_string(index=False))
+            
+        except Exception as e:
+            orchestrator.logger.exception("Pipeline failed: %s", e)
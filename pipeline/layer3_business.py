@@ -1,7 +1,6 @@
 # Layer 3: Business Analysis Pipeline
 # Creates aggregated views and analysis for business consumption
 
-import pandas as pd
 import sqlite3
 import logging
 from datetime import datetime
@@ -12,6 +11,16 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from pipeline_orchestrator import DataPipelineOrchestrator, DataQualityChecker
 
+# Win-back campaign tiers for one-time buyers by days since their order:
+# (min_days, max_days, campaign_type, priority_level, recommended_action); no max_days = open ended
+CAMPAIGN_TIERS = [
+    (14, 30, 'Early Engagement', 1, 'Send personalized product recommendations'),
+    (31, 60, 'Re-activation', 2, 'Offer 15% discount + free shipping'),
+    (61, 90, 'Win-back', 3, 'Limited-time 20% discount offer'),
+    (91, 180, 'Final Push', 4, 'Win-back campaign with survey'),
+    (181, None, 'Long-term Win-back', 5, 'Final 25% discount attempt')
+]
+
 class BusinessAnalysisLayer:
     """
     Layer 3: Business Analysis Layer
@@ -27,17 +36,73 @@ class BusinessAnalysisLayer:
         self.dq_checker = DataQualityChecker(orchestrator)
         self.logger = orchestrator.logger
         
+        # Business tables are rebuilt from the warehouse on every run, so relax durability
+        # the same way the warehouse layer does
+        self.business_conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA temp_store=MEMORY;
+            PRAGMA cache_size=-262144;
+            PRAGMA mmap_size=268435456;
+        """)
+        
         # Attach warehouse database to business connection for cross-database queries
         warehouse_db_path = f'{orchestrator.base_path}/warehouse.db'
         self.business_conn.execute(f"ATTACH DATABASE '{warehouse_db_path}' AS warehouse")
+        self._rollup_ready = False
         
+        # Insight text formats its numbers with Python's format() rather than SQLite's
+        # printf, which rounds some values differently (e.g. 1.075 -> '1.08' instead of
+        # '1.07'). NULL is formatted as 0, as printf would
+        self.business_conn.create_function(
+            'python_format', 2,
+            lambda value, spec: format(0 if value is None else value, spec),
+            deterministic=True
+        )
+        
+    def _drop_outdated_table(self, table_name: str, required_columns: list):
+        """
+        Drop a table from an older layout that lacks any of the given columns, so CREATE
+        TABLE IF NOT EXISTS recreates it. Only used for tables rebuilt on every run
+        """
+        table_columns = {name for (name,) in self.business_conn.execute(
+            "SELECT name FROM pragma_table_info(?)", (table_name,)
+        )}
+        if table_columns and not table_columns.issuperset(required_columns):
+            self.business_conn.execute(f"DROP TABLE {table_name}")
+            
     def create_business_schema(self):
         """Create business analysis tables"""
         
-        # Monthly aggregated metrics
-        self.business_conn.execute("""
+        # Older databases kept monthly_metrics without its integer year and month
+        self._drop_outdated_table('monthly_metrics', ['year', 'month'])
+        
+        # All of the DDL goes to SQLite in one script and one transaction
+        self.business_conn.executescript("""
+            BEGIN;
+            
+            -- Per customer per month roll-up of the fact table shared by the monthly,
+            -- cohort and retention builds (private and refilled every run, so it is simply
+            -- recreated rather than migrated). The month offset from the customer's cohort
+            -- is stored as an integer so the builders never parse cohort_month again
+            DROP TABLE IF EXISTS _mv_monthly_customer_rollup;
+            CREATE TABLE _mv_monthly_customer_rollup (
+                customer_id INTEGER,
+                cohort_month TEXT,
+                year INTEGER,
+                month INTEGER,
+                months_since_acquisition INTEGER,
+                orders INTEGER,
+                transactions INTEGER,
+                sales_amount_sum REAL,
+                PRIMARY KEY (customer_id, year, month)
+            );
+            
+            -- Monthly aggregated metrics
             CREATE TABLE IF NOT EXISTS monthly_metrics (
                 period_month TEXT PRIMARY KEY,
+                year INTEGER,
+                month INTEGER,
                 total_sales REAL,
                 avg_order_value REAL,
                 total_transactions INTEGER,
@@ -45,11 +110,9 @@ class BusinessAnalysisLayer:
                 unique_customers INTEGER,
                 purchase_frequency REAL,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Customer cohort analysis
-        self.business_conn.execute("""
+            );
+            
+            -- Customer cohort analysis
             CREATE TABLE IF NOT EXISTS cohort_analysis (
                 cohort_month TEXT,
                 activity_month TEXT, 
@@ -60,11 +123,9 @@ class BusinessAnalysisLayer:
                 total_sales REAL,
                 avg_order_value REAL,
                 PRIMARY KEY (cohort_month, activity_month)
-            )
-        """)
-        
-        # Cumulative Retention Analysis (addresses missing requirement)
-        self.business_conn.execute("""
+            );
+            
+            -- Cumulative Retention Analysis (addresses missing requirement)
             CREATE TABLE IF NOT EXISTS cumulative_retention_analysis (
                 cohort_month TEXT,
                 retention_window_months INTEGER,  -- 3, 12, 18
@@ -76,11 +137,9 @@ class BusinessAnalysisLayer:
                 avg_customer_value REAL,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 PRIMARY KEY (cohort_month, retention_window_months)
-            )
-        """)
-        
-        # Customer lifetime value analysis
-        self.business_conn.execute("""
+            );
+            
+            -- Customer lifetime value analysis
             CREATE TABLE IF NOT EXISTS customer_ltv_analysis (
                 customer_id INTEGER PRIMARY KEY,
                 acquisition_cohort TEXT,
@@ -91,11 +150,14 @@ class BusinessAnalysisLayer:
                 days_active INTEGER,
                 predicted_ltv_score INTEGER,
                 churn_risk_score REAL
-            )
-        """)
-        
-        # Customer Segmentation (RFM Analysis)
-        self.business_conn.execute("""
+            );
+            
+            -- Partial index for the high-LTV at-risk insight; only covers the few top scorers
+            CREATE INDEX IF NOT EXISTS idx_ltv_high_value_risk
+                ON customer_ltv_analysis(predicted_ltv_score, churn_risk_score)
+                WHERE predicted_ltv_score >= 4;
+            
+            -- Customer Segmentation (RFM Analysis)
             CREATE TABLE IF NOT EXISTS customer_segmentation (
                 customer_id INTEGER PRIMARY KEY,
                 recency_score INTEGER,      -- 1-5 scale
@@ -105,11 +167,9 @@ class BusinessAnalysisLayer:
                 segment_description TEXT,
                 recommended_strategy TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Campaign targeting table
-        self.business_conn.execute("""
+            );
+            
+            -- Campaign targeting table
             CREATE TABLE IF NOT EXISTS campaign_targets (
                 customer_id INTEGER,
                 campaign_type TEXT,
@@ -119,11 +179,9 @@ class BusinessAnalysisLayer:
                 recommended_action TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 PRIMARY KEY (customer_id, campaign_type)
-            )
-        """)
-        
-        # Business insights summary
-        self.business_conn.execute("""
+            );
+            
+            -- Business insights summary
             CREATE TABLE IF NOT EXISTS business_insights (
                 insight_id TEXT PRIMARY KEY,
                 insight_type TEXT,
@@ -133,11 +191,9 @@ class BusinessAnalysisLayer:
                 recommendation TEXT,
                 priority_level INTEGER,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        # Customer lifecycle snapshot (daily headcount by stage)
-        self.business_conn.execute("""
+            );
+            
+            -- Customer lifecycle snapshot (daily headcount by stage)
             CREATE TABLE IF NOT EXISTS customer_lifecycle_snapshot (
                 snapshot_date DATE,
                 lifecycle_stage TEXT,              -- New, Active, At Risk, Inactive
@@ -146,11 +202,18 @@ class BusinessAnalysisLayer:
                 avg_days_since_last_order REAL,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 PRIMARY KEY (snapshot_date, lifecycle_stage)
-            )
-        """)
-        
-        # Seasonal Trends Analysis
-        self.business_conn.execute("""
+            );
+            
+            -- Campaign tiers looked up by build_campaign_targets
+            CREATE TABLE IF NOT EXISTS campaign_tiers (
+                priority_level INTEGER PRIMARY KEY,
+                min_days INTEGER,
+                max_days INTEGER,
+                campaign_type TEXT,
+                recommended_action TEXT
+            );
+            
+            -- Seasonal Trends Analysis
             CREATE TABLE IF NOT EXISTS seasonal_trends (
                 period_type TEXT,          -- 'monthly', 'quarterly'
                 period_value TEXT,         -- '01' for Jan, 'Q1' for Q1
@@ -161,58 +224,109 @@ class BusinessAnalysisLayer:
                 trend_direction TEXT,      -- 'growing', 'declining', 'stable'
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 PRIMARY KEY (period_type, period_value)
-            )
+            );
+            
+            COMMIT;
         """)
+        self.business_conn.executemany("""
+            INSERT OR REPLACE INTO campaign_tiers (
+                min_days, max_days, campaign_type, priority_level, recommended_action
+            ) VALUES (?, ?, ?, ?, ?)
+        """, CAMPAIGN_TIERS)
+        
+        # The roll-up was just recreated empty, so the next builder has to refill it
+        self._rollup_ready = False
         
-        self.business_conn.commit()
         self.logger.info("Business analysis schema created successfully")
         
+    def _refresh_monthly_customer_rollup(self):
+        """Materialize fact_sales joined to dim_date and dim_customer once per run"""
+        
+        if self._rollup_ready:
+            return
+        
+        try:
+            self.business_conn.execute("BEGIN IMMEDIATE")
+            self.business_conn.execute("DELETE FROM _mv_monthly_customer_rollup")
+            self.business_conn.execute("""
+                INSERT INTO _mv_monthly_customer_rollup (
+                    customer_id, cohort_month, year, month, months_since_acquisition,
+                    orders, transactions, sales_amount_sum
+                )
+                SELECT
+                    c.customer_id,
+                    c.first_order_cohort_month,
+                    d.year,
+                    d.month,
+                    (d.year - c.first_order_cohort_year) * 12 +
+                    (d.month - CAST(substr(c.first_order_cohort_month, 6, 2) AS INTEGER)),
+                    COUNT(DISTINCT f.order_id),
+                    COUNT(*),
+                    SUM(f.sales_amount)
+                FROM warehouse.fact_sales f
+                JOIN warehouse.dim_date d ON f.date_id = d.date_id
+                JOIN warehouse.dim_customer c ON f.customer_id = c.customer_id
+                GROUP BY c.customer_id, d.year, d.month
+            """)
+            self.business_conn.execute("COMMIT")
+        except Exception:
+            if self.business_conn.in_transaction:
+                self.business_conn.execute("ROLLBACK")
+            raise
+        
+        self._rollup_ready = True
+        
     def build_monthly_metrics(self) -> str:
         """Build monthly aggregated metrics"""
         
         run_id = self.orchestrator.log_pipeline_run('BUSINESS', 'monthly_metrics', 'STARTED')
         
         try:
+            self._refresh_monthly_customer_rollup()
+            
             # Clear existing data #Must update to handle new - incoming data
+            self.business_conn.execute("BEGIN IMMEDIATE")
             self.business_conn.execute("DELETE FROM monthly_metrics")
             
             # Build monthly metrics from warehouse
-            self.business_conn.execute("""
+            cursor = self.business_conn.execute("""
                 INSERT INTO monthly_metrics (
-                    period_month, total_sales, avg_order_value, total_transactions,
+                    period_month, year, month, total_sales, avg_order_value, total_transactions,
                     total_orders, unique_customers, purchase_frequency
                 )
-                SELECT 
-                    d.year || '-' || printf('%02d', d.month) as period_month,
-                    SUM(f.sales_amount) as total_sales,
-                    AVG(f.sales_amount) as avg_order_value,
-                    COUNT(*) as total_transactions,
-                    COUNT(DISTINCT f.order_id) as total_orders,
-                    COUNT(DISTINCT f.customer_id) as unique_customers,
-                    ROUND(CAST(COUNT(DISTINCT f.order_id) AS FLOAT) / COUNT(DISTINCT f.customer_id), 2) as purchase_frequency
-                FROM warehouse.fact_sales f
-                JOIN warehouse.dim_date d ON f.date_id = d.date_id
-                GROUP BY d.year, d.month
-                ORDER BY d.year, d.month
+                SELECT
+                    r.year || '-' || printf('%02d', r.month) as period_month,
+                    r.year,
+                    r.month,
+                    SUM(r.sales_amount_sum) as total_sales,
+                    SUM(r.sales_amount_sum) / SUM(r.transactions) as avg_order_value,
+                    SUM(r.transactions) as total_transactions,
+                    SUM(r.orders) as total_orders,
+                    COUNT(*) as unique_customers,
+                    ROUND(CAST(SUM(r.orders) AS FLOAT) / COUNT(*), 2) as purchase_frequency
+                FROM _mv_monthly_customer_rollup r
+                GROUP BY r.year, r.month
             """)
             
+            self.business_conn.execute("COMMIT")
+            
             # Get row count
-            cursor = self.business_conn.execute("SELECT COUNT(*) FROM monthly_metrics")
-            row_count = cursor.fetchone()[0]
+            row_count = cursor.rowcount
             
             self.orchestrator.log_pipeline_run('BUSINESS', 'monthly_metrics', 'SUCCESS', row_count)
             
             # Run data quality checks
             self._run_monthly_metrics_quality_checks(run_id)
             
-            self.business_conn.commit()
-            self.logger.info(f"Monthly metrics built successfully with {row_count} rows")
+            self.logger.info("Monthly metrics built successfully with %s rows", row_count)
             
             return run_id
             
         except Exception as e:
+            if self.business_conn.in_transaction:
+                self.business_conn.execute("ROLLBACK")
             self.orchestrator.log_pipeline_run('BUSINESS', 'monthly_metrics', 'FAILED', 0, str(e))
-            self.logger.error(f"Failed to build monthly metrics: {str(e)}")
+            self.logger.error("Failed to build monthly metrics: %s", e)
             raise
             
     def build_cohort_analysis(self) -> str:
@@ -221,11 +335,14 @@ class BusinessAnalysisLayer:
         run_id = self.orchestrator.log_pipeline_run('BUSINESS', 'cohort_analysis', 'STARTED')
         
         try:
+            self._refresh_monthly_customer_rollup()
+            
             # Clear existing data
+            self.business_conn.execute("BEGIN IMMEDIATE")
             self.business_conn.execute("DELETE FROM cohort_analysis")
             
             # Build cohort analysis from warehouse
-            self.business_conn.execute("""
+            cursor = self.business_conn.execute("""
                 INSERT INTO cohort_analysis (
                     cohort_month, activity_month, months_since_acquisition,
                     cohort_size, active_customers, retention_rate_percent,
@@ -239,18 +356,15 @@ class BusinessAnalysisLayer:
                     GROUP BY first_order_cohort_month
                 ),
                 monthly_activity AS (
-                    SELECT 
-                        c.first_order_cohort_month as cohort_month,
-                        d.year || '-' || printf('%02d', d.month) as activity_month,
-                        (d.year - c.first_order_cohort_year) * 12 + 
-                        (d.month - CAST(substr(c.first_order_cohort_month, 6, 2) AS INTEGER)) as months_since_acquisition,
-                        COUNT(DISTINCT f.customer_id) as active_customers,
-                        SUM(f.sales_amount) as total_sales,
-                        AVG(f.sales_amount) as avg_order_value
-                    FROM warehouse.fact_sales f
-                    JOIN warehouse.dim_date d ON f.date_id = d.date_id
-                    JOIN warehouse.dim_customer c ON f.customer_id = c.customer_id
-                    GROUP BY c.first_order_cohort_month, d.year, d.month
+                    SELECT
+                        r.cohort_month,
+                        r.year || '-' || printf('%02d', r.month) as activity_month,
+                        r.months_since_acquisition,
+                        COUNT(*) as active_customers,
+                        SUM(r.sales_amount_sum) as total_sales,
+                        SUM(r.sales_amount_sum) / SUM(r.transactions) as avg_order_value
+                    FROM _mv_monthly_customer_rollup r
+                    GROUP BY r.cohort_month, r.year, r.month
                 )
                 SELECT 
                     ma.cohort_month,
@@ -264,26 +378,27 @@ class BusinessAnalysisLayer:
                 FROM monthly_activity ma
                 JOIN cohort_sizes cs ON ma.cohort_month = cs.cohort_month
                 WHERE ma.months_since_acquisition >= 0
-                ORDER BY ma.cohort_month, ma.months_since_acquisition
             """)
             
+            self.business_conn.execute("COMMIT")
+            
             # Get row count
-            cursor = self.business_conn.execute("SELECT COUNT(*) FROM cohort_analysis")
-            row_count = cursor.fetchone()[0]
+            row_count = cursor.rowcount
             
             self.orchestrator.log_pipeline_run('BUSINESS', 'cohort_analysis', 'SUCCESS', row_count)
             
             # Run data quality checks
             self._run_cohort_analysis_quality_checks(run_id)
             
-            self.business_conn.commit()
-            self.logger.info(f"Cohort analysis built successfully with {row_count} rows")
+            self.logger.info("Cohort analysis built successfully with %s rows", row_count)
             
             return run_id
             
         except Exception as e:
+            if self.business_conn.in_transaction:
+                self.business_conn.execute("ROLLBACK")
             self.orchestrator.log_pipeline_run('BUSINESS', 'cohort_analysis', 'FAILED', 0, str(e))
-            self.logger.error(f"Failed to build cohort analysis: {str(e)}")
+            self.logger.error("Failed to build cohort analysis: %s", e)
             raise
 
     def build_cumulative_retention_analysis(self) -> str:
@@ -292,71 +407,89 @@ class BusinessAnalysisLayer:
         run_id = self.orchestrator.log_pipeline_run('BUSINESS', 'cumulative_retention_analysis', 'STARTED')
         
         try:
+            self._refresh_monthly_customer_rollup()
+            
             # Clear existing data
+            self.business_conn.execute("BEGIN IMMEDIATE")
             self.business_conn.execute("DELETE FROM cumulative_retention_analysis")
             
-            # Build cumulative retention for each window
-            for window_months in [3, 12, 18]:
-                self.business_conn.execute("""
-                    INSERT INTO cumulative_retention_analysis (
-                        cohort_month, retention_window_months, cohort_size, 
-                        active_customers, cumulative_retention_rate, 
-                        avg_purchase_frequency, total_revenue, avg_customer_value
-                    )
-                    WITH cohort_sizes AS (
-                        SELECT 
-                            first_order_cohort_month as cohort_month,
-                            COUNT(DISTINCT customer_id) as cohort_size
-                        FROM warehouse.dim_customer
-                        WHERE first_order_cohort_month IS NOT NULL
-                        GROUP BY first_order_cohort_month
-                    ),
-                    cohort_activity AS (
-                        SELECT 
-                            c.first_order_cohort_month as cohort_month,
-                            COUNT(DISTINCT f.customer_id) as active_customers,
-                            COUNT(DISTINCT f.order_id) as total_orders,
-                            SUM(f.sales_amount) as total_revenue
-                        FROM warehouse.fact_sales f
-                        JOIN warehouse.dim_date d ON f.date_id = d.date_id
-                        JOIN warehouse.dim_customer c ON f.customer_id = c.customer_id
-                        WHERE (d.year - c.first_order_cohort_year) * 12 + 
-                              (d.month - CAST(substr(c.first_order_cohort_month, 6, 2) AS INTEGER)) 
-                              BETWEEN 0 AND ?
-                        GROUP BY c.first_order_cohort_month
-                    )
+            # Build all three windows in one pass over the roll-up: aggregate each window
+            # conditionally per cohort, then emit one row per cohort and window
+            cursor = self.business_conn.execute("""
+                INSERT INTO cumulative_retention_analysis (
+                    cohort_month, retention_window_months, cohort_size, 
+                    active_customers, cumulative_retention_rate, 
+                    avg_purchase_frequency, total_revenue, avg_customer_value
+                )
+                WITH cohort_sizes AS (
                     SELECT 
-                        ca.cohort_month,
-                        ? as retention_window_months,
-                        cs.cohort_size,
-                        ca.active_customers,
-                        ROUND(CAST(ca.active_customers AS FLOAT) / cs.cohort_size * 100, 2) as cumulative_retention_rate,
-                        ROUND(CAST(ca.total_orders AS FLOAT) / ca.active_customers, 2) as avg_purchase_frequency,
-                        ca.total_revenue,
-                        ROUND(ca.total_revenue / ca.active_customers, 2) as avg_customer_value
-                    FROM cohort_activity ca
-                    JOIN cohort_sizes cs ON ca.cohort_month = cs.cohort_month
-                    WHERE cs.cohort_size >= 10 
-                    ORDER BY ca.cohort_month
-                """, (window_months, window_months))
+                        first_order_cohort_month as cohort_month,
+                        COUNT(DISTINCT customer_id) as cohort_size
+                    FROM warehouse.dim_customer
+                    WHERE first_order_cohort_month IS NOT NULL
+                    GROUP BY first_order_cohort_month
+                ),
+                window_activity AS (
+                    SELECT
+                        cohort_month,
+                        COUNT(DISTINCT CASE WHEN months_since_acquisition BETWEEN 0 AND 3 THEN customer_id END) as active_3,
+                        SUM(CASE WHEN months_since_acquisition BETWEEN 0 AND 3 THEN orders END) as orders_3,
+                        SUM(CASE WHEN months_since_acquisition BETWEEN 0 AND 3 THEN sales_amount_sum END) as revenue_3,
+                        COUNT(DISTINCT CASE WHEN months_since_acquisition BETWEEN 0 AND 12 THEN customer_id END) as active_12,
+                        SUM(CASE WHEN months_since_acquisition BETWEEN 0 AND 12 THEN orders END) as orders_12,
+                        SUM(CASE WHEN months_since_acquisition BETWEEN 0 AND 12 THEN sales_amount_sum END) as revenue_12,
+                        COUNT(DISTINCT CASE WHEN months_since_acquisition BETWEEN 0 AND 18 THEN customer_id END) as active_18,
+                        SUM(CASE WHEN months_since_acquisition BETWEEN 0 AND 18 THEN orders END) as orders_18,
+                        SUM(CASE WHEN months_since_acquisition BETWEEN 0 AND 18 THEN sales_amount_sum END) as revenue_18
+                    FROM _mv_monthly_customer_rollup
+                    GROUP BY cohort_month
+                ),
+                windows(window_months) AS (
+                    VALUES (3), (12), (18)
+                ),
+                cohort_activity AS (
+                    SELECT
+                        wa.cohort_month,
+                        w.window_months,
+                        CASE w.window_months WHEN 3 THEN wa.active_3 WHEN 12 THEN wa.active_12 ELSE wa.active_18 END as active_customers,
+                        CASE w.window_months WHEN 3 THEN wa.orders_3 WHEN 12 THEN wa.orders_12 ELSE wa.orders_18 END as total_orders,
+                        CASE w.window_months WHEN 3 THEN wa.revenue_3 WHEN 12 THEN wa.revenue_12 ELSE wa.revenue_18 END as total_revenue
+                    FROM window_activity wa
+                    CROSS JOIN windows w
+                )
+                SELECT 
+                    ca.cohort_month,
+                    ca.window_months as retention_window_months,
+                    cs.cohort_size,
+                    ca.active_customers,
+                    ROUND(CAST(ca.active_customers AS FLOAT) / cs.cohort_size * 100, 2) as cumulative_retention_rate,
+                    ROUND(CAST(ca.total_orders AS FLOAT) / ca.active_customers, 2) as avg_purchase_frequency,
+                    ca.total_revenue,
+                    ROUND(ca.total_revenue / ca.active_customers, 2) as avg_customer_value
+                FROM cohort_activity ca
+                JOIN cohort_sizes cs ON ca.cohort_month = cs.cohort_month
+                WHERE cs.cohort_size >= 10 
+                  AND ca.active_customers > 0
+            """)
             
-            # Get row count
-            cursor = self.business_conn.execute("SELECT COUNT(*) FROM cumulative_retention_analysis")
-            row_count = cursor.fetchone()[0]
+            self.business_conn.execute("COMMIT")
             
-            self.business_conn.commit()
+            # Get row count
+            row_count = cursor.rowcount
             
             # Run data quality checks
             self._run_cumulative_retention_quality_checks(run_id)
             
             self.orchestrator.log_pipeline_run('BUSINESS', 'cumulative_retention_analysis', 'SUCCESS', row_count)
-            self.logger.info(f"Cumulative retention analysis built with {row_count} rows")
+            self.logger.info("Cumulative retention analysis built with %s rows", row_count)
             
             return run_id
             
         except Exception as e:
+            if self.business_conn.in_transaction:
+                self.business_conn.execute("ROLLBACK")
             self.orchestrator.log_pipeline_run('BUSINESS', 'cumulative_retention_analysis', 'FAILED', 0, str(e))
-            self.logger.error(f"Failed to build cumulative retention analysis: {str(e)}")
+            self.logger.error("Failed to build cumulative retention analysis: %s", e)
             raise
             
     def build_customer_ltv_analysis(self) -> str:
@@ -366,35 +499,42 @@ class BusinessAnalysisLayer:
         
         try:
             # Clear existing data
+            self.business_conn.execute("BEGIN IMMEDIATE")
             self.business_conn.execute("DELETE FROM customer_ltv_analysis")
             
             # Build LTV analysis from warehouse
-            self.business_conn.execute("""
+            cursor = self.business_conn.execute("""
                 INSERT INTO customer_ltv_analysis (
                     customer_id, acquisition_cohort, customer_segment, total_orders,
                     total_spent, avg_order_value, days_active, predicted_ltv_score, churn_risk_score
                 )
-                WITH customer_order_timing AS (
+                WITH second_purchase AS (
+                    SELECT 
+                        customer_id,
+                        MIN(days_since_customer_first_order) as days_to_second_purchase
+                    FROM warehouse.dim_order
+                    WHERE customer_order_sequence = 2
+                    GROUP BY customer_id
+                ),
+                customer_order_timing AS (
                     SELECT 
                         c.customer_id,
                         c.first_order_cohort_month as acquisition_cohort,
-                        c.customer_segment,
+                        segment.label as customer_segment,
                         c.total_orders,
                         c.total_spent,
                         c.avg_order_value,
                         c.days_since_first_order as days_active,
                         c.days_since_last_order,
-                        -- Calculate second purchase timing for LTV prediction
+                        -- Second purchase timing for LTV prediction
                         CASE 
                             WHEN c.total_orders = 1 THEN NULL
-                            ELSE (
-                                SELECT MIN(o2.days_since_customer_first_order)
-                                FROM warehouse.dim_order o2
-                                WHERE o2.customer_id = c.customer_id 
-                                AND o2.customer_order_sequence = 2
-                            )
+                            ELSE sp.days_to_second_purchase
                         END as days_to_second_purchase
                     FROM warehouse.dim_customer c
+                    LEFT JOIN warehouse.dim_code_lookup segment 
+                        ON segment.code_type = 'customer_segment' AND segment.code = c.customer_segment
+                    LEFT JOIN second_purchase sp ON sp.customer_id = c.customer_id
                 ),
                 ltv_scored AS (
                     SELECT *,
@@ -424,23 +564,25 @@ class BusinessAnalysisLayer:
                 FROM ltv_scored
             """)
             
+            self.business_conn.execute("COMMIT")
+            
             # Get row count
-            cursor = self.business_conn.execute("SELECT COUNT(*) FROM customer_ltv_analysis")
-            row_count = cursor.fetchone()[0]
+            row_count = cursor.rowcount
             
             self.orchestrator.log_pipeline_run('BUSINESS', 'customer_ltv_analysis', 'SUCCESS', row_count)
             
             # Run data quality checks
             self._run_ltv_analysis_quality_checks(run_id)
             
-            self.business_conn.commit()
-            self.logger.info(f"Customer LTV analysis built successfully with {row_count} rows")
+            self.logger.info("Customer LTV analysis built successfully with %s rows", row_count)
             
             return run_id
             
         except Exception as e:
+            if self.business_conn.in_transaction:
+                self.business_conn.execute("ROLLBACK")
             self.orchestrator.log_pipeline_run('BUSINESS', 'customer_ltv_analysis', 'FAILED', 0, str(e))
-            self.logger.error(f"Failed to build customer LTV analysis: {str(e)}")
+            self.logger.error("Failed to build customer LTV analysis: %s", e)
             raise
 
     def build_customer_segmentation(self) -> str:
@@ -450,26 +592,26 @@ class BusinessAnalysisLayer:
         
         try:
             # Clear existing data
+            self.business_conn.execute("BEGIN IMMEDIATE")
             self.business_conn.execute("DELETE FROM customer_segmentation")
             
+            # Recency is measured against the latest loaded date, bound as a constant
+            max_date = self.business_conn.execute("SELECT MAX(full_date) FROM warehouse.dim_date").fetchone()[0]
+            
             # Build RFM segmentation
-            self.business_conn.execute("""
+            cursor = self.business_conn.execute("""
                 INSERT INTO customer_segmentation (
                     customer_id, recency_score, frequency_score, monetary_score,
                     rfm_segment, segment_description, recommended_strategy
                 )
-                WITH dataset_dates AS (
-                    SELECT MAX(full_date) as max_date FROM warehouse.dim_date
-                ),
-                customer_recency AS (
+                WITH customer_recency AS (
                     SELECT 
                         c.customer_id,
                         c.total_orders,
                         c.total_spent,
                         -- Calculate recency relative to dataset max date, not current date
-                        julianday(dd.max_date) - julianday(c.last_order_date) as days_since_last_order_relative
+                        julianday(?) - julianday(c.last_order_date) as days_since_last_order_relative
                     FROM warehouse.dim_customer c
-                    CROSS JOIN dataset_dates dd
                 ),
                 rfm_scores AS (
                     SELECT 
@@ -528,21 +670,25 @@ class BusinessAnalysisLayer:
                         ELSE 'Standard marketing approach'
                     END as recommended_strategy
                 FROM segmented
-            """)
+                -- NTILE leaves rows in spend order; re-sort so the rowid b-tree is appended to
+                ORDER BY customer_id
+            """, (max_date,))
+            
+            self.business_conn.execute("COMMIT")
             
             # Get row count
-            cursor = self.business_conn.execute("SELECT COUNT(*) FROM customer_segmentation")
-            row_count = cursor.fetchone()[0]
+            row_count = cursor.rowcount
             
-            self.business_conn.commit()
             self.orchestrator.log_pipeline_run('BUSINESS', 'customer_segmentation', 'SUCCESS', row_count)
-            self.logger.info(f"Customer segmentation built with {row_count} rows")
+            self.logger.info("Customer segmentation built with %s rows", row_count)
             
             return run_id
             
         except Exception as e:
+            if self.business_conn.in_transaction:
+                self.business_conn.execute("ROLLBACK")
             self.orchestrator.log_pipeline_run('BUSINESS', 'customer_segmentation', 'FAILED', 0, str(e))
-            self.logger.error(f"Failed to build customer segmentation: {str(e)}")
+            self.logger.error("Failed to build customer segmentation: %s", e)
             raise
 
     def build_seasonal_trends(self) -> str:
@@ -552,10 +698,11 @@ class BusinessAnalysisLayer:
         
         try:
             # Clear existing data
+            self.business_conn.execute("BEGIN IMMEDIATE")
             self.business_conn.execute("DELETE FROM seasonal_trends")
             
             # Monthly seasonal trends
-            self.business_conn.execute("""
+            cursor = self.business_conn.execute("""
                 INSERT INTO seasonal_trends (
                     period_type, period_value, avg_sales, avg_orders, 
                     avg_customers, seasonal_index, trend_direction
@@ -566,12 +713,12 @@ class BusinessAnalysisLayer:
                 monthly_trends AS (
                     SELECT 
                         'monthly' as period_type,
-                        substr(period_month, 6, 2) as period_value,
+                        printf('%02d', month) as period_value,
                         AVG(total_sales) as avg_sales,
                         AVG(total_orders) as avg_orders,
                         AVG(unique_customers) as avg_customers
                     FROM monthly_metrics
-                    GROUP BY substr(period_month, 6, 2)
+                    GROUP BY month
                 )
                 SELECT 
                     mt.period_type,
@@ -591,19 +738,21 @@ class BusinessAnalysisLayer:
                 CROSS JOIN monthly_avg ma
             """)
             
+            self.business_conn.execute("COMMIT")
+            
             # Get row count
-            cursor = self.business_conn.execute("SELECT COUNT(*) FROM seasonal_trends")
-            row_count = cursor.fetchone()[0]
+            row_count = cursor.rowcount
             
-            self.business_conn.commit()
             self.orchestrator.log_pipeline_run('BUSINESS', 'seasonal_trends', 'SUCCESS', row_count)
-            self.logger.info(f"Seasonal trends built with {row_count} rows")
+            self.logger.info("Seasonal trends built with %s rows", row_count)
             
             return run_id
             
         except Exception as e:
+            if self.business_conn.in_transaction:
+                self.business_conn.execute("ROLLBACK")
             self.orchestrator.log_pipeline_run('BUSINESS', 'seasonal_trends', 'FAILED', 0, str(e))
-            self.logger.error(f"Failed to build seasonal trends: {str(e)}")
+            self.logger.error("Failed to build seasonal trends: %s", e)
             raise
             
     def build_campaign_targets(self) -> str:
@@ -613,10 +762,11 @@ class BusinessAnalysisLayer:
         
         try:
             # Clear existing data
+            self.business_conn.execute("BEGIN IMMEDIATE")
             self.business_conn.execute("DELETE FROM campaign_targets")
             
             # Build campaign targets from customer analysis
-            self.business_conn.execute("""
+            cursor = self.business_conn.execute("""
                 INSERT INTO campaign_targets (
                     customer_id, campaign_type, priority_level, estimated_value,
                     days_since_last_order, recommended_action
@@ -634,63 +784,48 @@ class BusinessAnalysisLayer:
                     WHERE c.total_orders = 1  -- Focus on one-time buyers
                 ),
                 campaign_logic AS (
+                    -- One range lookup per customer; customers outside every tier get no campaign
                     SELECT 
-                        customer_id,
-                        days_since_last_order,
-                        total_spent as estimated_value,
-                        churn_risk_score,
-                        predicted_ltv_score,
-                        CASE 
-                            WHEN days_since_last_order BETWEEN 14 AND 30 THEN 'Early Engagement'
-                            WHEN days_since_last_order BETWEEN 31 AND 60 THEN 'Re-activation'
-                            WHEN days_since_last_order BETWEEN 61 AND 90 THEN 'Win-back'
-                            WHEN days_since_last_order BETWEEN 91 AND 180 THEN 'Final Push'
-                            WHEN days_since_last_order > 180 THEN 'Long-term Win-back'
-                            ELSE NULL
-                        END as campaign_type,
-                        CASE 
-                            WHEN days_since_last_order BETWEEN 14 AND 30 THEN 1
-                            WHEN days_since_last_order BETWEEN 31 AND 60 THEN 2
-                            WHEN days_since_last_order BETWEEN 61 AND 90 THEN 3
-                            WHEN days_since_last_order BETWEEN 91 AND 180 THEN 4
-                            WHEN days_since_last_order > 180 THEN 5
-                            ELSE 99
-                        END as priority_level,
-                        CASE 
-                            WHEN days_since_last_order BETWEEN 14 AND 30 THEN 'Send personalized product recommendations'
-                            WHEN days_since_last_order BETWEEN 31 AND 60 THEN 'Offer 15% discount + free shipping'
-                            WHEN days_since_last_order BETWEEN 61 AND 90 THEN 'Limited-time 20% discount offer'
-                            WHEN days_since_last_order BETWEEN 91 AND 180 THEN 'Win-back campaign with survey'
-                            WHEN days_since_last_order > 180 THEN 'Final 25% discount attempt'
-                            ELSE 'Monitor for future campaigns'
-                        END as recommended_action
-                    FROM customer_campaign_data
+                        ccd.customer_id,
+                        ccd.days_since_last_order,
+                        ccd.total_spent as estimated_value,
+                        ccd.churn_risk_score,
+                        ccd.predicted_ltv_score,
+                        t.campaign_type,
+                        t.priority_level,
+                        t.recommended_action
+                    FROM customer_campaign_data ccd
+                    JOIN campaign_tiers t
+                        ON ccd.days_since_last_order >= t.min_days
+                        AND (t.max_days IS NULL OR ccd.days_since_last_order <= t.max_days)
                 )
                 SELECT 
                     customer_id, campaign_type, priority_level, estimated_value,
                     days_since_last_order, recommended_action
                 FROM campaign_logic
-                WHERE campaign_type IS NOT NULL
-                ORDER BY priority_level, estimated_value DESC
+                -- Feed rows in primary key order so the key index is appended to, not split
+                ORDER BY customer_id, campaign_type
             """)
             
+            self.business_conn.execute("COMMIT")
+            
             # Get row count
-            cursor = self.business_conn.execute("SELECT COUNT(*) FROM campaign_targets")
-            row_count = cursor.fetchone()[0]
+            row_count = cursor.rowcount
             
             self.orchestrator.log_pipeline_run('BUSINESS', 'campaign_targets', 'SUCCESS', row_count)
             
             # Run data quality checks
             self._run_campaign_targets_quality_checks(run_id)
             
-            self.business_conn.commit()
-            self.logger.info(f"Campaign targets built successfully with {row_count} rows")
+            self.logger.info("Campaign targets built successfully with %s rows", row_count)
             
             return run_id
             
         except Exception as e:
+            if self.business_conn.in_transaction:
+                self.business_conn.execute("ROLLBACK")
             self.orchestrator.log_pipeline_run('BUSINESS', 'campaign_targets', 'FAILED', 0, str(e))
-            self.logger.error(f"Failed to build campaign targets: {str(e)}")
+            self.logger.error("Failed to build campaign targets: %s", e)
             raise
 
     def build_customer_lifecycle_snapshot(self) -> str:
@@ -724,6 +859,7 @@ class BusinessAnalysisLayer:
                 return run_id
 
             # We rebuild the snapshot for the latest date (idempotent upsert)
+            self.business_conn.execute("BEGIN IMMEDIATE")
             self.business_conn.execute("""
                 DELETE FROM customer_lifecycle_snapshot
                 WHERE snapshot_date = ?
@@ -731,7 +867,7 @@ class BusinessAnalysisLayer:
 
             # Materialize lifecycle stage per rules. We compute a stage label per customer,
             # then roll up counts and shares.
-            self.business_conn.execute("""
+            cursor = self.business_conn.execute("""
                 INSERT INTO customer_lifecycle_snapshot (
                     snapshot_date, lifecycle_stage, customers, share_of_base, avg_days_since_last_order
                 )
@@ -754,15 +890,12 @@ class BusinessAnalysisLayer:
                         END AS lifecycle_stage
                     FROM warehouse.dim_customer c
                 ),
-                totals AS (
-                    SELECT COUNT(*) AS total_customers FROM base
-                ),
                 rolled AS (
                     SELECT
                         ? AS snapshot_date,
                         lifecycle_stage,
                         COUNT(*) AS customers,
-                        AVG(CAST(days_since_last_order AS REAL)) AS avg_days_since_last_order
+                        AVG(days_since_last_order) AS avg_days_since_last_order
                     FROM base
                     GROUP BY lifecycle_stage
                 )
@@ -770,10 +903,10 @@ class BusinessAnalysisLayer:
                     r.snapshot_date,
                     r.lifecycle_stage,
                     r.customers,
-                    ROUND(r.customers * 1.0 / t.total_customers, 4) AS share_of_base,
+                    -- Total customers summed over the stage rows, so dim_customer is scanned once
+                    ROUND(r.customers * 1.0 / SUM(r.customers) OVER (), 4) AS share_of_base,
                     ROUND(COALESCE(r.avg_days_since_last_order, 0), 2) AS avg_days_since_last_order
                 FROM rolled r
-                CROSS JOIN totals t
                 ORDER BY
                     CASE r.lifecycle_stage
                         WHEN 'New' THEN 1
@@ -784,23 +917,23 @@ class BusinessAnalysisLayer:
                     END
             """, (snapshot_date,))
 
+            self.business_conn.execute("COMMIT")
+            
             # Row count inserted for this snapshot date
-            row_count = self.business_conn.execute("""
-                SELECT COUNT(*) FROM customer_lifecycle_snapshot
-                WHERE snapshot_date = ?
-            """, (snapshot_date,)).fetchone()[0]
+            row_count = cursor.rowcount
 
             # Optional DQ checks
             self._run_lifecycle_snapshot_quality_checks(run_id, snapshot_date)
 
-            self.business_conn.commit()
             self.orchestrator.log_pipeline_run('BUSINESS', 'customer_lifecycle_snapshot', 'SUCCESS', row_count)
-            self.logger.info(f"Customer lifecycle snapshot built for {snapshot_date} with {row_count} rows.")
+            self.logger.info("Customer lifecycle snapshot built for %s with %s rows.", snapshot_date, row_count)
             return run_id
 
         except Exception as e:
+            if self.business_conn.in_transaction:
+                self.business_conn.execute("ROLLBACK")
             self.orchestrator.log_pipeline_run('BUSINESS', 'customer_lifecycle_snapshot', 'FAILED', 0, str(e))
-            self.logger.error(f"Failed to build customer lifecycle snapshot: {str(e)}")
+            self.logger.error("Failed to build customer lifecycle snapshot: %s", e)
             raise
 
     def generate_business_insights(self) -> str:
@@ -810,201 +943,166 @@ class BusinessAnalysisLayer:
         
         try:
             # Clear existing insights
+            self.business_conn.execute("BEGIN IMMEDIATE")
             self.business_conn.execute("DELETE FROM business_insights")
             
-            insights = []
-            
-            # Insight 1: Overall conversion rate
+            # All insights in one statement: each CTE is one source query and each
+            # UNION ALL branch formats one insight (rows without data are skipped)
             cursor = self.business_conn.execute("""
+                INSERT INTO business_insights 
+                (insight_id, insight_type, insight_title, insight_description, 
+                 metric_value, recommendation, priority_level)
+                WITH conversion AS (
+                    SELECT 
+                        COUNT(*) as total_customers,
+                        SUM(CASE WHEN total_orders = 1 THEN 1 ELSE 0 END) as one_time_buyers,
+                        ROUND(SUM(CASE WHEN total_orders = 1 THEN 1 ELSE 0 END) * 100.0 / COUNT(*), 2) as one_time_rate
+                    FROM customer_ltv_analysis
+                ),
+                best_cohort AS (
+                    SELECT 
+                        cohort_month,
+                        AVG(retention_rate_percent) as avg_retention
+                    FROM cohort_analysis
+                    WHERE months_since_acquisition = 1
+                    GROUP BY cohort_month
+                    ORDER BY avg_retention DESC
+                    LIMIT 1
+                ),
+                best_retention AS (
+                    SELECT 
+                        cohort_month,
+                        AVG(CASE WHEN retention_window_months = 3 THEN cumulative_retention_rate END) as retention_3m,
+                        AVG(CASE WHEN retention_window_months = 12 THEN cumulative_retention_rate END) as retention_12m,
+                        AVG(CASE WHEN retention_window_months = 18 THEN cumulative_retention_rate END) as retention_18m
+                    FROM cumulative_retention_analysis
+                    GROUP BY cohort_month
+                    ORDER BY retention_12m DESC
+                    LIMIT 1
+                ),
+                at_risk AS (
+                    SELECT 
+                        COUNT(*) as high_value_at_risk,
+                        SUM(total_spent) as revenue_at_risk
+                    FROM customer_ltv_analysis
+                    WHERE predicted_ltv_score >= 4 AND churn_risk_score >= 0.5
+                ),
+                segments AS (
+                    SELECT 
+                        rfm_segment,
+                        COUNT(*) as segment_size,
+                        ROUND(COUNT(*) * 100.0 / (SELECT COUNT(*) FROM customer_segmentation), 1) as segment_percent
+                    FROM customer_segmentation
+                    WHERE rfm_segment IN ('Champions', 'At Risk', 'Cannot Lose Them')
+                ),
+                top_campaign AS (
+                    SELECT 
+                        campaign_type,
+                        COUNT(*) as target_count,
+                        SUM(estimated_value) as total_opportunity
+                    FROM campaign_targets
+                    WHERE priority_level <= 2
+                    GROUP BY campaign_type
+                    ORDER BY SUM(estimated_value) DESC
+                    LIMIT 1
+                ),
+                month_names(month, month_name) AS (
+                    VALUES ('01', 'January'), ('02', 'February'), ('03', 'March'), ('04', 'April'),
+                           ('05', 'May'), ('06', 'June'), ('07', 'July'), ('08', 'August'),
+                           ('09', 'September'), ('10', 'October'), ('11', 'November'), ('12', 'December')
+                ),
+                peak_season AS (
+                    SELECT 
+                        COALESCE(m.month_name, s.period_value) as month_name,
+                        s.seasonal_index,
+                        s.trend_direction
+                    FROM seasonal_trends s
+                    LEFT JOIN month_names m ON m.month = s.period_value
+                    WHERE s.period_type = 'monthly'
+                    ORDER BY s.seasonal_index DESC
+                    LIMIT 1
+                )
                 SELECT 
-                    COUNT(*) as total_customers,
-                    SUM(CASE WHEN total_orders = 1 THEN 1 ELSE 0 END) as one_time_buyers,
-                    ROUND(SUM(CASE WHEN total_orders = 1 THEN 1 ELSE 0 END) * 100.0 / COUNT(*), 2) as one_time_rate
-                FROM customer_ltv_analysis
-            """)
-            result = cursor.fetchone()
-            
-            insights.append({
-                'insight_id': 'CONV_001',
-                'insight_type': 'CONVERSION',
-                'insight_title': 'Customer Conversion Rate',
-                'insight_description': f'Out of {result[0]:,} customers, {result[1]:,} ({result[2]}%) are one-time buyers',
-                'metric_value': result[2],
-                'recommendation': 'Implement automated email sequences to convert one-time buyers',
-                'priority_level': 1
-            })
-            
-            # Insight 2: Best converting cohort
-            cursor = self.business_conn.execute("""
+                    'CONV_001', 'CONVERSION', 'Customer Conversion Rate',
+                    printf('Out of %,d customers, %,d (%s%%) are one-time buyers',
+                           total_customers, one_time_buyers, one_time_rate),
+                    one_time_rate,
+                    'Implement automated email sequences to convert one-time buyers',
+                    1
+                FROM conversion
+                UNION ALL
                 SELECT 
-                    cohort_month,
-                    AVG(retention_rate_percent) as avg_retention
-                FROM cohort_analysis
-                WHERE months_since_acquisition = 1
-                GROUP BY cohort_month
-                ORDER BY avg_retention DESC
-                LIMIT 1
-            """)
-            result = cursor.fetchone()
-            
-            if result:
-                insights.append({
-                    'insight_id': 'COH_001',
-                    'insight_type': 'COHORT',
-                    'insight_title': 'Best Performing Cohort',
-                    'insight_description': f'Cohort {result[0]} has the highest month-1 retention at {result[1]:.1f}%',
-                    'metric_value': result[1],
-                    'recommendation': 'Analyze and replicate the acquisition strategies used for this cohort',
-                    'priority_level': 2
-                })
-            
-            # NEW: Cumulative retention insights
-            cursor = self.business_conn.execute("""
+                    'COH_001', 'COHORT', 'Best Performing Cohort',
+                    printf('Cohort %s has the highest month-1 retention at %s%%',
+                           cohort_month, python_format(avg_retention, '.1f')),
+                    avg_retention,
+                    'Analyze and replicate the acquisition strategies used for this cohort',
+                    2
+                FROM best_cohort
+                UNION ALL
                 SELECT 
-                    cohort_month,
-                    AVG(CASE WHEN retention_window_months = 3 THEN cumulative_retention_rate END) as retention_3m,
-                    AVG(CASE WHEN retention_window_months = 12 THEN cumulative_retention_rate END) as retention_12m,
-                    AVG(CASE WHEN retention_window_months = 18 THEN cumulative_retention_rate END) as retention_18m
-                FROM cumulative_retention_analysis
-                GROUP BY cohort_month
-                ORDER BY retention_12m DESC
-                LIMIT 1
-            """)
-            result = cursor.fetchone()
-            
-            if result and result[2]:  # Check if 12m retention exists
-                insights.append({
-                    'insight_id': 'RET_001',
-                    'insight_type': 'RETENTION',
-                    'insight_title': 'Best Retention Cohort Performance',
-                    'insight_description': f'Cohort {result[0]} shows strongest retention: 3m={result[1]:.1f}%, 12m={result[2]:.1f}%, 18m={result[3]:.1f}%',
-                    'metric_value': result[2],
-                    'recommendation': 'Analyze acquisition channels and onboarding for this cohort to replicate success',
-                    'priority_level': 1
-                })
-            
-            # Insight 3: High-value at-risk customers
-            cursor = self.business_conn.execute("""
+                    'RET_001', 'RETENTION', 'Best Retention Cohort Performance',
+                    printf('Cohort %s shows strongest retention: 3m=%s%%, 12m=%s%%, 18m=%s%%',
+                           cohort_month, python_format(retention_3m, '.1f'),
+                           python_format(retention_12m, '.1f'), python_format(retention_18m, '.1f')),
+                    retention_12m,
+                    'Analyze acquisition channels and onboarding for this cohort to replicate success',
+                    1
+                FROM best_retention
+                WHERE retention_12m <> 0  -- Only if 12m retention exists
+                UNION ALL
                 SELECT 
-                    COUNT(*) as high_value_at_risk,
-                    SUM(total_spent) as revenue_at_risk
-                FROM customer_ltv_analysis
-                WHERE predicted_ltv_score >= 4 AND churn_risk_score >= 0.5
-            """)
-            result = cursor.fetchone()
-            
-            insights.append({
-                'insight_id': 'RISK_001',
-                'insight_type': 'CHURN_RISK',
-                'insight_title': 'High-Value Customers at Risk',
-                'insight_description': f'{result[0]} high-LTV customers are at risk, representing ${result[1]:,.2f} in potential lost revenue',
-                'metric_value': result[0],
-                'recommendation': 'Immediate intervention with personalized offers for high-LTV at-risk customers',
-                'priority_level': 1
-            })
-            
-            # NEW: Segmentation insights
-            cursor = self.business_conn.execute("""
+                    'RISK_001', 'CHURN_RISK', 'High-Value Customers at Risk',
+                    printf('%d high-LTV customers are at risk, representing $%s in potential lost revenue',
+                           high_value_at_risk, python_format(revenue_at_risk, ',.2f')),
+                    high_value_at_risk,
+                    'Immediate intervention with personalized offers for high-LTV at-risk customers',
+                    1
+                FROM at_risk
+                UNION ALL
                 SELECT 
-                    rfm_segment,
-                    COUNT(*) as segment_size,
-                    ROUND(COUNT(*) * 100.0 / (SELECT COUNT(*) FROM customer_segmentation), 1) as segment_percent
-                FROM customer_segmentation
-                WHERE rfm_segment IN ('Champions', 'At Risk', 'Cannot Lose Them')
-                ORDER BY segment_size DESC
-            """)
-            
-            for row in cursor.fetchall():
-                segment, size, percent = row
-                insights.append({
-                    'insight_id': f'SEG_{segment[:3].upper()}',
-                    'insight_type': 'SEGMENTATION',
-                    'insight_title': f'{segment} Segment Analysis',
-                    'insight_description': f'{size:,} customers ({percent}%) in {segment} segment',
-                    'metric_value': percent,
-                    'recommendation': f'Focus on {segment.lower()} with targeted campaigns',
-                    'priority_level': 2 if segment == 'Champions' else 1
-                })
-            
-            # Insight 4: Campaign opportunity
-            cursor = self.business_conn.execute("""
+                    'SEG_' || upper(substr(rfm_segment, 1, 3)), 'SEGMENTATION', rfm_segment || ' Segment Analysis',
+                    printf('%,d customers (%s%%) in %s segment', segment_size, segment_percent, rfm_segment),
+                    segment_percent,
+                    'Focus on ' || lower(rfm_segment) || ' with targeted campaigns',
+                    CASE WHEN rfm_segment = 'Champions' THEN 2 ELSE 1 END
+                FROM segments
+                WHERE rfm_segment IS NOT NULL
+                UNION ALL
                 SELECT 
-                    campaign_type,
-                    COUNT(*) as target_count,
-                    SUM(estimated_value) as total_opportunity
-                FROM campaign_targets
-                WHERE priority_level <= 2
-                GROUP BY campaign_type
-                ORDER BY total_opportunity DESC
-                LIMIT 1
-            """)
-            result = cursor.fetchone()
-            
-            if result:
-                insights.append({
-                    'insight_id': 'CAMP_001',
-                    'insight_type': 'CAMPAIGN',
-                    'insight_title': 'Top Campaign Opportunity',
-                    'insight_description': f'{result[1]} customers ready for {result[0]} campaigns, ${result[2]:,.2f} potential value',
-                    'metric_value': result[1],
-                    'recommendation': f'Launch {result[0]} campaign immediately',
-                    'priority_level': 1
-                })
-                
-            # NEW: Seasonal insights
-            cursor = self.business_conn.execute("""
+                    'CAMP_001', 'CAMPAIGN', 'Top Campaign Opportunity',
+                    printf('%d customers ready for %s campaigns, $%s potential value',
+                           target_count, campaign_type, python_format(total_opportunity, ',.2f')),
+                    target_count,
+                    'Launch ' || campaign_type || ' campaign immediately',
+                    1
+                FROM top_campaign
+                UNION ALL
                 SELECT 
-                    period_value as month,
+                    'SEAS_001', 'SEASONAL', 'Peak Seasonal Performance',
+                    printf('%s is peak month with %sx average performance (%s trend)',
+                           month_name, python_format(seasonal_index, '.2f'), trend_direction),
                     seasonal_index,
-                    trend_direction
-                FROM seasonal_trends
-                WHERE period_type = 'monthly'
-                ORDER BY seasonal_index DESC
-                LIMIT 1
+                    'Increase marketing spend and inventory for ' || month_name,
+                    2
+                FROM peak_season
             """)
-            result = cursor.fetchone()
-            
-            if result:
-                month_names = {
-                    '01': 'January', '02': 'February', '03': 'March', '04': 'April',
-                    '05': 'May', '06': 'June', '07': 'July', '08': 'August',
-                    '09': 'September', '10': 'October', '11': 'November', '12': 'December'
-                }
-                month_name = month_names.get(result[0], result[0])
-                
-                insights.append({
-                    'insight_id': 'SEAS_001',
-                    'insight_type': 'SEASONAL',
-                    'insight_title': 'Peak Seasonal Performance',
-                    'insight_description': f'{month_name} is peak month with {result[1]:.2f}x average performance ({result[2]} trend)',
-                    'metric_value': result[1],
-                    'recommendation': f'Increase marketing spend and inventory for {month_name}',
-                    'priority_level': 2
-                })
-            
-            # Insert insights into table
-            for insight in insights:
-                self.business_conn.execute("""
-                    INSERT INTO business_insights 
-                    (insight_id, insight_type, insight_title, insight_description, 
-                     metric_value, recommendation, priority_level)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    insight['insight_id'], insight['insight_type'], insight['insight_title'],
-                    insight['insight_description'], insight['metric_value'], 
-                    insight['recommendation'], insight['priority_level']
-                ))
-            
-            self.orchestrator.log_pipeline_run('BUSINESS', 'business_insights', 'SUCCESS', len(insights))
-            
-            self.business_conn.commit()
-            self.logger.info(f"Generated {len(insights)} business insights")
+            self.business_conn.execute("COMMIT")
+            
+            # Get row count
+            row_count = cursor.rowcount
+            
+            self.orchestrator.log_pipeline_run('BUSINESS', 'business_insights', 'SUCCESS', row_count)
+            
+            self.logger.info("Generated %s business insights", row_count)
             
             return run_id
             
         except Exception as e:
+            if self.business_conn.in_transaction:
+                self.business_conn.execute("ROLLBACK")
             self.orchestrator.log_pipeline_run('BUSINESS', 'business_insights', 'FAILED', 0, str(e))
-            self.logger.error(f"Failed to generate business insights: {str(e)}")
+            self.logger.error("Failed to generate business insights: %s", e)
             raise
             
     def _run_monthly_metrics_quality_checks(self, run_id: str):
@@ -1055,15 +1153,17 @@ class BusinessAnalysisLayer:
         # Check retention rates don't increase over time (logical impossibility)
         try:
             cursor = self.business_conn.execute("""
-                SELECT COUNT(*) FROM (
+                SELECT COUNT(DISTINCT cohort_month) FROM (
+                    -- Compare each window with the next shorter one in the same cohort
                     SELECT cohort_month,
-                        MAX(CASE WHEN retention_window_months = 3 THEN cumulative_retention_rate END) as ret_3m,
-                        MAX(CASE WHEN retention_window_months = 12 THEN cumulative_retention_rate END) as ret_12m,
-                        MAX(CASE WHEN retention_window_months = 18 THEN cumulative_retention_rate END) as ret_18m
+                        cumulative_retention_rate,
+                        LAG(cumulative_retention_rate) OVER (
+                            PARTITION BY cohort_month ORDER BY retention_window_months
+                        ) as prev_retention_rate
                     FROM cumulative_retention_analysis 
-                    GROUP BY cohort_month
-                    HAVING ret_12m > ret_3m OR ret_18m > ret_12m
+                    WHERE retention_window_months IN (3, 12, 18)
                 )
+                WHERE cumulative_retention_rate > prev_retention_rate
             """)
             invalid_trends = cursor.fetchone()[0]
             
@@ -1164,9 +1264,12 @@ class BusinessAnalysisLayer:
             'customer_ltv_analysis', 'customer_segmentation', 'seasonal_trends',
             'campaign_targets', 'business_insights', 'customer_lifecycle_snapshot'
         ]
-        for table in tables:
-            cursor = self.business_conn.execute(f"SELECT COUNT(*) FROM {table}")
-            summary[f'{table}_rows'] = cursor.fetchone()[0]
+        # One compound query instead of a round-trip per table
+        cursor = self.business_conn.execute(" UNION ALL ".join(
+            f"SELECT '{table}', COUNT(*) FROM {table}" for table in tables
+        ))
+        for table, row_count in cursor.fetchall():
+            summary[f'{table}_rows'] = row_count
             
         # Key business metrics
         cursor = self.business_conn.execute("""
@@ -1257,7 +1360,7 @@ def run_business_analysis_pipeline(orchestrator=None):
         
         # Get summary
         summary = business.get_business_summary()
-        business.logger.info(f"Business analysis pipeline completed successfully: {summary}")
+        business.logger.info("Business analysis pipeline completed successfully: %s", summary)
         
         print("BUSINESS ANALYSIS LAYER SUMMARY:")
         print("=" * 50)
@@ -1278,26 +1381,28 @@ def run_business_analysis_pipeline(orchestrator=None):
         print(f"At-risk customers: {summary['at_risk_customers']:,}")
         
         # Show top insights
-        insights_df = pd.read_sql_query("""
-            SELECT insight_title, insight_description, recommendation, priority_level
+        insights = business.business_conn.execute("""
+            SELECT insight_title, insight_description, recommendation
             FROM business_insights
             ORDER BY priority_level, metric_value DESC
-        """, business.business_conn)
+        """).fetchall()
         
-        if len(insights_df) > 0:
+        if insights:
             print(f"\nTop Business Insights:")
             print("-" * 30)
-            for _, insight in insights_df.iterrows():
-                print(f"• {insight['insight_title']}")
-                print(f"  {insight['insight_description']}")
-                print(f"  Recommendation: {insight['recommendation']}")
-                print()
+            # One blank-line separated block per insight, written in a single print
+            print("\n".join(
+                f"• {title}\n  {description}\n  Recommendation: {recommendation}\n"
+                for title, description, recommendation in insights
+            ))
         
         return orchestrator, summary
         
     except Exception as e:
-        orchestrator.logger.error(f"Business analysis pipeline failed: {str(e)}")
+        orchestrator.logger.error("Business analysis pipeline failed: %s", e)
         raise
+    finally:
+        orchestrator.flush_runs()
 
 
 # Example usage
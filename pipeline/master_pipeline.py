@@ -79,7 +79,7 @@ class MasterPipelineRunner:
                         'duration': (datetime.now() - layer1_start).total_seconds(),
                         'error': str(e)
                     }
-                    self.logger.error(f"Layer 1 failed: {str(e)}")
+                    self.logger.error("Layer 1 failed: %s", e)
                     raise
             else:
                 self.logger.info("Skipping Layer 1: Staging Pipeline")
@@ -108,7 +108,7 @@ class MasterPipelineRunner:
                         'duration': (datetime.now() - layer2_start).total_seconds(),
                         'error': str(e)
                     }
-                    self.logger.error(f"Layer 2 failed: {str(e)}")
+                    self.logger.error("Layer 2 failed: %s", e)
                     raise
             else:
                 self.logger.info("Skipping Layer 2: Data Warehouse Pipeline")
@@ -134,7 +134,7 @@ class MasterPipelineRunner:
                         'duration': (datetime.now() - layer3_start).total_seconds(),
                         'error': str(e)
                     }
-                    self.logger.error(f"Layer 3 failed: {str(e)}")
+                    self.logger.error("Layer 3 failed: %s", e)
                     raise
             else:
                 self.logger.info("Skipping Layer 3: Business Analysis Pipeline")
@@ -144,7 +144,7 @@ class MasterPipelineRunner:
             
             self.logger.info("=" * 60)
             self.logger.info("MASTER PIPELINE COMPLETED SUCCESSFULLY")
-            self.logger.info(f"Total duration: {total_duration:.2f} seconds")
+            self.logger.info("Total duration: %.2f seconds", total_duration)
             self.logger.info("=" * 60)
             
             return True
@@ -153,8 +153,8 @@ class MasterPipelineRunner:
             total_duration = (datetime.now() - pipeline_start_time).total_seconds()
             self.logger.error("=" * 60)
             self.logger.error("MASTER PIPELINE FAILED")
-            self.logger.error(f"Error: {str(e)}")
-            self.logger.error(f"Duration until failure: {total_duration:.2f} seconds")
+            self.logger.error("Error: %s", e)
+            self.logger.error("Duration until failure: %.2f seconds", total_duration)
             self.logger.error("=" * 60)
             return False
             
@@ -238,9 +238,9 @@ class MasterPipelineRunner:
                     print(f"  Cleaned records: {summary.get('cleaned_records', 0):,}")
                     
                 elif layer_name == 'layer2':
-                    print(f"  Unique customers: {summary.get('unique_customers', 0):,}")
-                    print(f"  Total transactions: {summary.get('total_transactions', 0):,}")
-                    print(f"  Total revenue: ${summary.get('total_revenue', 0):,.2f}")
+                    print(f"  Unique customers: {summary.unique_customers:,}")
+                    print(f"  Total transactions: {summary.total_transactions:,}")
+                    print(f"  Total revenue: ${summary.total_revenue:,.2f}")
                     
                 elif layer_name == 'layer3':
                     print(f"  Campaign targets: {summary.get('campaign_targets_rows', 0):,}")
@@ -276,7 +276,7 @@ class MasterPipelineRunner:
                     print("  No data quality checks recorded")
             except Exception as e:
                 print(f"  Error retrieving data quality summary: {str(e)}")
-                self.logger.error(f"Data quality summary error: {str(e)}")
+                self.logger.error("Data quality summary error: %s", e)
                 
         print("\n" + "=" * 70)
 
@@ -6,6 +6,13 @@ from typing import Dict, List, Tuple
 import json
 import os
 
+def connect(db_path: str) -> sqlite3.Connection:
+    """
+    Open a pipeline database in autocommit mode
+    Multi-statement writes are grouped explicitly with BEGIN IMMEDIATE ... COMMIT
+    """
+    return sqlite3.connect(db_path, isolation_level=None)
+
 class DataPipelineOrchestrator:
     """
     Main orchestrator for the 3-layer data engineering pipeline
@@ -20,10 +27,10 @@ class DataPipelineOrchestrator:
         
         # Database connections
         self.databases = {
-            'staging': sqlite3.connect(f'{base_path}/staging.db'),
-            'warehouse': sqlite3.connect(f'{base_path}/warehouse.db'),
-            'business': sqlite3.connect(f'{base_path}/business.db'),
-            'metadata': sqlite3.connect(f'{base_path}/metadata.db')
+            'staging': connect(f'{base_path}/staging.db'),
+            'warehouse': connect(f'{base_path}/warehouse.db'),
+            'business': connect(f'{base_path}/business.db'),
+            'metadata': connect(f'{base_path}/metadata.db')
         }
         
         # Setup logging
@@ -37,6 +44,17 @@ class DataPipelineOrchestrator:
         )
         self.logger = logging.getLogger(__name__)
         
+        # Pipeline run rows waiting to be written by flush_runs(), keyed by run_id, and the
+        # STARTED run currently open for each (layer, table_name)
+        self._pending_runs = {}
+        self._open_runs = {}
+        
+        # Data quality check rows waiting to be written by flush_runs()
+        self._pending_checks = []
+        
+        # Status and data quality summaries, kept until flush_runs() writes new rows
+        self._summary_cache = {}
+        
         # Initialize metadata tables
         self._setup_metadata_tables()
         
@@ -90,72 +108,108 @@ class DataPipelineOrchestrator:
         
     def log_pipeline_run(self, layer: str, table_name: str, status: str, 
                         row_count: int = None, error_message: str = None) -> str:
-        """Log pipeline run information"""
+        """
+        Log pipeline run information
+        Runs are buffered in memory and written in one batch by flush_runs(); a final
+        status (SUCCESS/FAILED) closes the open STARTED run for the same layer and table
+        """
         run_id = f"{layer}_{table_name}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
         
-        metadata_conn = self.databases['metadata']
-        
         if status == 'STARTED':
-            metadata_conn.execute("""
-                INSERT INTO pipeline_runs 
-                (run_id, layer, table_name, status, start_time)
-                VALUES (?, ?, ?, ?, ?)
-            """, (run_id, layer, table_name, status, datetime.now()))
+            run = [run_id, layer, table_name, status, datetime.now(), None, None, None]
+            self._open_runs[(layer, table_name)] = run
         else:
-            metadata_conn.execute("""
-                UPDATE pipeline_runs 
-                SET status = ?, end_time = ?, row_count = ?, error_message = ?
-                WHERE run_id = ?
-            """, (status, datetime.now(), row_count, error_message, run_id))
-        
-        metadata_conn.commit()
+            run = self._open_runs.pop((layer, table_name), None)
+            if run is None:
+                # No STARTED run to close
+                return run_id
+            run_id = run[0]
+            run[3] = status
+            run[5:] = [datetime.now(), row_count, error_message]
+            
+        self._pending_runs[run_id] = run
         return run_id
         
-    def log_data_quality_check(self, run_id: str, table_name: str, check_type: str,
-                              check_name: str, expected: str, actual: str, 
-                              status: str, error_details: str = None):
-        """Log data quality check results"""
-        check_id = f"{run_id}_{check_name}_{datetime.now().strftime('%H%M%S_%f')}"
-        
+    def flush_runs(self):
+        """
+        Write buffered pipeline runs and data quality checks to the metadata database
+        in a single batch
+        """
+        if not self._pending_runs and not self._pending_checks:
+            return
+            
         metadata_conn = self.databases['metadata']
-        metadata_conn.execute("""
+        metadata_conn.execute("BEGIN IMMEDIATE")
+        metadata_conn.executemany("""
+            INSERT OR REPLACE INTO pipeline_runs 
+            (run_id, layer, table_name, status, start_time, end_time, row_count, error_message)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, self._pending_runs.values())
+        metadata_conn.executemany("""
             INSERT INTO data_quality_checks 
             (check_id, run_id, table_name, check_type, check_name, 
              expected_value, actual_value, status, error_details, check_time)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (check_id, run_id, table_name, check_type, check_name, 
-              expected, actual, status, error_details, datetime.now()))
+        """, self._pending_checks)
+        metadata_conn.execute("COMMIT")
+        self._pending_runs.clear()
+        self._pending_checks.clear()
+        self._summary_cache.clear()
         
-        metadata_conn.commit()
+    def log_data_quality_check(self, run_id: str, table_name: str, check_type: str,
+                              check_name: str, expected: str, actual: str, 
+                              status: str, error_details: str = None):
+        """
+        Log data quality check results
+        Results are buffered with the pipeline runs and written by flush_runs()
+        """
+        check_id = f"{run_id}_{check_name}_{datetime.now().strftime('%H%M%S_%f')}"
+        
+        self._pending_checks.append((
+            check_id, run_id, table_name, check_type, check_name, 
+            expected, actual, status, error_details, datetime.now()
+        ))
         
     def get_pipeline_status(self) -> pd.DataFrame:
         """Get current pipeline status"""
-        metadata_conn = self.databases['metadata']
-        return pd.read_sql_query("""
-            SELECT layer, table_name, status, start_time, end_time, row_count, error_message
-            FROM pipeline_runs 
-            ORDER BY start_time DESC 
-            LIMIT 20
-        """, metadata_conn)
+        self.flush_runs()
+        if 'pipeline_status' not in self._summary_cache:
+            self._summary_cache['pipeline_status'] = pd.read_sql_query("""
+                SELECT layer, table_name, status, start_time, end_time, row_count, error_message
+                FROM pipeline_runs 
+                ORDER BY start_time DESC 
+                LIMIT 20
+            """, self.databases['metadata'])
+        return self._summary_cache['pipeline_status'].copy()
         
     def get_data_quality_summary(self) -> pd.DataFrame:
         """Get data quality check summary"""
-        metadata_conn = self.databases['metadata']
-        return pd.read_sql_query("""
-            SELECT table_name, check_type, 
-                   COUNT(*) as total_checks,
-                   SUM(CASE WHEN status = 'PASSED' THEN 1 ELSE 0 END) as passed,
-                   SUM(CASE WHEN status = 'FAILED' THEN 1 ELSE 0 END) as failed
-            FROM data_quality_checks 
-            GROUP BY table_name, check_type
-            ORDER BY table_name
-        """, metadata_conn)
+        self.flush_runs()
+        if 'data_quality_summary' not in self._summary_cache:
+            self._summary_cache['data_quality_summary'] = pd.read_sql_query("""
+                SELECT table_name, check_type, 
+                       COUNT(*) as total_checks,
+                       SUM(CASE WHEN status = 'PASSED' THEN 1 ELSE 0 END) as passed,
+                       SUM(CASE WHEN status = 'FAILED' THEN 1 ELSE 0 END) as failed
+                FROM data_quality_checks 
+                GROUP BY table_name, check_type
+                ORDER BY table_name
+            """, self.databases['metadata'])
+        return self._summary_cache['data_quality_summary'].copy()
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close_connections()
+        return False
         
     def close_connections(self):
         """Close all database connections"""
+        self.flush_runs()
         for db_name, conn in self.databases.items():
             conn.close()
-            self.logger.info(f"Closed {db_name} database connection")
+            self.logger.info("Closed %s database connection", db_name)
 
 
 class DataQualityChecker:
@@ -172,23 +226,10 @@ class DataQualityChecker:
             cursor = conn.execute(f"SELECT COUNT(*) FROM {table_name}")
             actual_count = cursor.fetchone()[0]
             
-            status = "PASSED" if actual_count >= min_rows else "FAILED"
-            
-            self.orchestrator.log_data_quality_check(
-                run_id, table_name, "ROW_COUNT", "min_rows_check",
-                str(min_rows), str(actual_count), status
-            )
-            
-            if status == "FAILED":
-                self.logger.warning(f"Row count check failed for {table_name}: {actual_count} < {min_rows}")
-                
-            return status == "PASSED"
+            return self._evaluate_row_count(table_name, min_rows, actual_count, run_id)
             
         except Exception as e:
-            self.orchestrator.log_data_quality_check(
-                run_id, table_name, "ROW_COUNT", "min_rows_check",
-                str(min_rows), "ERROR", "FAILED", str(e)
-            )
+            self._log_check_error(table_name, ('ROW_COUNT', None, min_rows), run_id, e)
             return False
             
     def check_null_percentage(self, conn: sqlite3.Connection, table_name: str,
@@ -204,21 +245,12 @@ class DataQualityChecker:
             result = cursor.fetchone()
             total_rows, null_rows = result
             
-            actual_null_pct = (null_rows / total_rows * 100) if total_rows > 0 else 0
-            status = "PASSED" if actual_null_pct <= max_null_pct else "FAILED"
-            
-            self.orchestrator.log_data_quality_check(
-                run_id, table_name, "NULL_CHECK", f"{column_name}_null_check",
-                f"<={max_null_pct}%", f"{actual_null_pct:.2f}%", status
+            return self._evaluate_null_percentage(
+                table_name, column_name, max_null_pct, total_rows, null_rows, run_id
             )
             
-            return status == "PASSED"
-            
         except Exception as e:
-            self.orchestrator.log_data_quality_check(
-                run_id, table_name, "NULL_CHECK", f"{column_name}_null_check",
-                f"<={max_null_pct}%", "ERROR", "FAILED", str(e)
-            )
+            self._log_check_error(table_name, ('NULL_CHECK', column_name, max_null_pct), run_id, e)
             return False
             
     def check_unique_count(self, conn: sqlite3.Connection, table_name: str,
@@ -228,22 +260,113 @@ class DataQualityChecker:
             cursor = conn.execute(f"SELECT COUNT(DISTINCT {column_name}) FROM {table_name}")
             actual_unique = cursor.fetchone()[0]
             
-            status = "PASSED" if actual_unique >= min_unique else "FAILED"
+            return self._evaluate_unique_count(table_name, column_name, min_unique, actual_unique, run_id)
             
-            self.orchestrator.log_data_quality_check(
-                run_id, table_name, "UNIQUENESS", f"{column_name}_unique_check",
-                f">={min_unique}", str(actual_unique), status
-            )
-            
-            return status == "PASSED"
+        except Exception as e:
+            self._log_check_error(table_name, ('UNIQUENESS', column_name, min_unique), run_id, e)
+            return False
             
+    def check_batch(self, conn: sqlite3.Connection, table_name: str,
+                    specs: List[Tuple[str, str, float]], run_id: str) -> bool:
+        """
+        Run several row-count / null / uniqueness checks on one table in a single scan.
+        Each spec is (check_type, column_name, threshold) with check_type one of
+        'ROW_COUNT' (column_name ignored), 'NULL_CHECK' or 'UNIQUENESS'; column names
+        are validated against pragma_table_info.
+        Results are logged exactly as the individual check_* methods log them.
+        """
+        # Column names are interpolated into the query, so only accept real columns of the table
+        table_columns = {
+            row[0] for row in conn.execute("SELECT name FROM pragma_table_info(?)", (table_name,))
+        }
+        
+        aggregates = ["COUNT(*)"]
+        for check_type, column_name, _ in specs:
+            if check_type != 'ROW_COUNT' and column_name not in table_columns:
+                raise ValueError(f"Unknown column for {table_name}: {column_name}")
+            if check_type == 'NULL_CHECK':
+                aggregates.append(f"SUM({column_name} IS NULL)")
+            elif check_type == 'UNIQUENESS':
+                aggregates.append(f"COUNT(DISTINCT {column_name})")
+            elif check_type == 'ROW_COUNT':
+                aggregates.append("NULL")
+            else:
+                raise ValueError(f"Unsupported batch check type: {check_type}")
+                
+        try:
+            cursor = conn.execute(f"SELECT {', '.join(aggregates)} FROM {table_name}")
+            total_rows, *values = cursor.fetchone()
         except Exception as e:
-            self.orchestrator.log_data_quality_check(
-                run_id, table_name, "UNIQUENESS", f"{column_name}_unique_check",
-                f">={min_unique}", "ERROR", "FAILED", str(e)
-            )
+            for spec in specs:
+                self._log_check_error(table_name, spec, run_id, e)
             return False
             
+        results = []
+        for (check_type, column_name, threshold), value in zip(specs, values):
+            if check_type == 'ROW_COUNT':
+                results.append(self._evaluate_row_count(table_name, threshold, total_rows, run_id))
+            elif check_type == 'NULL_CHECK':
+                results.append(self._evaluate_null_percentage(
+                    table_name, column_name, threshold, total_rows, value, run_id
+                ))
+            else:
+                results.append(self._evaluate_unique_count(table_name, column_name, threshold, value, run_id))
+                
+        return all(results)
+        
+    def _evaluate_row_count(self, table_name: str, min_rows: int, actual_count: int, run_id: str) -> bool:
+        """Evaluate and log a minimum row count result"""
+        status = "PASSED" if actual_count >= min_rows else "FAILED"
+        
+        self.orchestrator.log_data_quality_check(
+            run_id, table_name, "ROW_COUNT", "min_rows_check",
+            str(min_rows), str(actual_count), status
+        )
+        
+        if status == "FAILED":
+            self.logger.warning("Row count check failed for %s: %s < %s", table_name, actual_count, min_rows)
+            
+        return status == "PASSED"
+        
+    def _evaluate_null_percentage(self, table_name: str, column_name: str, max_null_pct: float,
+                                  total_rows: int, null_rows: int, run_id: str) -> bool:
+        """Evaluate and log a null percentage result"""
+        actual_null_pct = (null_rows / total_rows * 100) if total_rows > 0 else 0
+        status = "PASSED" if actual_null_pct <= max_null_pct else "FAILED"
+        
+        self.orchestrator.log_data_quality_check(
+            run_id, table_name, "NULL_CHECK", f"{column_name}_null_check",
+            f"<={max_null_pct}%", f"{actual_null_pct:.2f}%", status
+        )
+        
+        return status == "PASSED"
+        
+    def _evaluate_unique_count(self, table_name: str, column_name: str, min_unique: int,
+                               actual_unique: int, run_id: str) -> bool:
+        """Evaluate and log a minimum unique count result"""
+        status = "PASSED" if actual_unique >= min_unique else "FAILED"
+        
+        self.orchestrator.log_data_quality_check(
+            run_id, table_name, "UNIQUENESS", f"{column_name}_unique_check",
+            f">={min_unique}", str(actual_unique), status
+        )
+        
+        return status == "PASSED"
+        
+    def _log_check_error(self, table_name: str, spec: Tuple[str, str, float], run_id: str, error: Exception):
+        """Log a check that could not be evaluated"""
+        check_type, column_name, threshold = spec
+        if check_type == 'ROW_COUNT':
+            check_name, expected = "min_rows_check", str(threshold)
+        elif check_type == 'NULL_CHECK':
+            check_name, expected = f"{column_name}_null_check", f"<={threshold}%"
+        else:
+            check_name, expected = f"{column_name}_unique_check", f">={threshold}"
+            
+        self.orchestrator.log_data_quality_check(
+            run_id, table_name, check_type, check_name, expected, "ERROR", "FAILED", str(error)
+        )
+            
     def check_date_range(self, conn: sqlite3.Connection, table_name: str,
                         date_column: str, min_date: str, max_date: str, run_id: str) -> bool:
         """Check date range validity"""
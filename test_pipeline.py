@@ -762,12 +762,278 @@ def run_retention_analysis_test():
         test_suite.cleanup()
 
 
+def run_staging_cache_test(csv_file_path: str = None):
+    """Check that the staging cache hits on unchanged input and misses for a copied or rewritten CSV"""
+    print("🗄️  Testing staging cache keys...")
+    
+    from pipeline.layer1_staging import StagingLayer
+    
+    csv_file_path = csv_file_path or './data/raw/HEC_testing_data_sample_2_.csv'
+    test_dir = tempfile.mkdtemp(prefix='staging_cache_test_')
+    orchestrator = None
+    
+    try:
+        # Work on a small copy of the sample so the test can rewrite it
+        test_csv = os.path.join(test_dir, 'sales.csv')
+        with open(csv_file_path) as source, open(test_csv, 'w') as target:
+            for _, line in zip(range(201), source):
+                target.write(line)
+                
+        orchestrator = DataPipelineOrchestrator(os.path.join(test_dir, 'data'))
+        staging = StagingLayer(orchestrator)
+        staging.create_staging_schema()
+        
+        # Cold cache: nothing has been saved yet
+        cache_key = staging.compute_cache_key(test_csv)
+        assert staging.get_cached_summary(cache_key) is None, "empty cache returned a summary"
+        
+        staging.ingest_raw_data(test_csv)
+        clean_run_id = staging.clean_and_validate_data()
+        summary = staging.get_staging_summary()
+        staging.save_cached_summary(cache_key, clean_run_id, summary)
+        
+        # Nothing changed: same key, and the saved summary comes back
+        assert staging.compute_cache_key(test_csv) == cache_key, "cache key changed without a file change"
+        assert staging.get_cached_summary(cache_key) == summary, "cache missed on unchanged input"
+        print(f"   ✅ Cache hit on unchanged input ({summary['raw_records']} raw records)")
+        
+        # The same bytes under another path are a separate file to append: a miss as well
+        copied_csv = os.path.join(test_dir, 'sales_copy.csv')
+        shutil.copyfile(test_csv, copied_csv)
+        copied_key = staging.compute_cache_key(copied_csv)
+        assert copied_key != cache_key, "cache key ignores the file path"
+        assert staging.get_cached_summary(copied_key) is None, "cache hit for a copy at another path"
+        print("   ✅ Cache miss for an identical file at another path")
+        
+        # Rewrite the CSV with one sales value changed: new key, and the lookup misses
+        with open(test_csv) as f:
+            lines = f.readlines()
+        fields = lines[1].rstrip('\n').split(',')
+        fields[-1] = str(float(fields[-1]) + 1)
+        lines[1] = ','.join(fields) + '\n'
+        with open(test_csv, 'w') as f:
+            f.writelines(lines)
+            
+        new_key = staging.compute_cache_key(test_csv)
+        assert new_key != cache_key, "cache key did not change after the CSV was rewritten"
+        assert staging.get_cached_summary(new_key) is None, "cache hit after the CSV was rewritten"
+        print("   ✅ Cache miss after the CSV was rewritten")
+        
+        return True
+        
+    except Exception as e:
+        print(f"   ❌ Staging cache test failed: {str(e)}")
+        return False
+        
+    finally:
+        if orchestrator:
+            orchestrator.close_connections()
+        shutil.rmtree(test_dir, ignore_errors=True)
+
+
+def run_order_quartile_test():
+    """Check dim_order's amount quartiles against SQL NTILE(4) on a small fixture with ties"""
+    print("📊 Testing order amount quartiles against NTILE(4)...")
+    
+    from pipeline.layer1_staging import StagingLayer
+    from pipeline.layer2_warehouse import WarehouseLayer
+    
+    # (date, customer_id, order_id, sales): 20.00 and 35.00 are repeated across customers and
+    # dates in an order that differs from order_id, so ties straddle the bucket boundaries
+    fixture = [
+        ('2021-01-03', 300, 1, 50.00),
+        ('2021-01-07', 100, 2, 20.00),
+        ('2021-01-06', 200, 3, 20.00),
+        ('2021-01-05', 100, 4, 20.00),
+        ('2021-01-04', 400, 5, 35.00),
+        ('2021-01-01', 500, 6, 10.00),
+        ('2021-01-02', 200, 7, 20.00),
+        ('2021-01-02', 300, 8, 50.00),
+        ('2021-01-07', 600, 9, 5.00),
+        ('2021-01-03', 100, 10, 35.00),
+    ]
+    
+    test_dir = tempfile.mkdtemp(prefix='order_quartile_test_')
+    orchestrator = None
+    
+    try:
+        test_csv = os.path.join(test_dir, 'sales.csv')
+        
+        # Row counts with remainders of 2, 3 and 0, and one smaller than the number of buckets
+        for row_count in (10, 7, 8, 3):
+            with open(test_csv, 'w') as f:
+                f.write(',Date,Customer ID,Order ID,Sales\n')
+                for i, (date, customer_id, order_id, sales) in enumerate(fixture[:row_count]):
+                    f.write(f'{i},{date},{customer_id},{order_id},{sales:.2f}\n')
+                    
+            # Fresh databases for each fixture size
+            orchestrator = DataPipelineOrchestrator(os.path.join(test_dir, f'data_{row_count}'))
+            
+            staging = StagingLayer(orchestrator)
+            staging.create_staging_schema()
+            staging.ingest_raw_data(test_csv)
+            staging.clean_and_validate_data()
+            
+            warehouse = WarehouseLayer(orchestrator)
+            warehouse.create_warehouse_schema()
+            warehouse.build_order_dimension()
+            
+            # build_order_dimension breaks amount ties by (customer_id, date_parsed, order_id)
+            expected = dict(staging.staging_conn.execute("""
+                SELECT order_id, NTILE(4) OVER (
+                    ORDER BY sales_amount, customer_id, date_parsed, order_id
+                )
+                FROM stg_sales_cleaned
+                WHERE data_quality_flag = 'VALID'
+            """).fetchall())
+            actual = dict(warehouse.warehouse_conn.execute(
+                "SELECT order_id, order_amount_quartile FROM dim_order"
+            ).fetchall())
+            
+            assert len(expected) == row_count, f"expected {row_count} valid orders, got {len(expected)}"
+            assert actual == expected, f"quartiles differ for {row_count} rows: {actual} != {expected}"
+            print(f"   ✅ {row_count} orders: quartiles match NTILE(4)")
+            
+            orchestrator.close_connections()
+            orchestrator = None
+            
+        return True
+        
+    except Exception as e:
+        print(f"   ❌ Order quartile test failed: {str(e)}")
+        return False
+        
+    finally:
+        if orchestrator:
+            orchestrator.close_connections()
+        shutil.rmtree(test_dir, ignore_errors=True)
+
+
+def run_failed_run_logging_test():
+    """Check that a run that fails before any flush is written as FAILED when the orchestrator closes"""
+    print("📝 Testing failed run logging...")
+    
+    test_dir = tempfile.mkdtemp(prefix='failed_run_test_')
+    data_path = os.path.join(test_dir, 'data')
+    
+    try:
+        orchestrator = DataPipelineOrchestrator(data_path)
+        try:
+            run_id = orchestrator.log_pipeline_run('STAGING', 'stg_sales_raw', 'STARTED')
+            try:
+                raise RuntimeError("simulated load failure")
+            except RuntimeError as e:
+                orchestrator.log_pipeline_run('STAGING', 'stg_sales_raw', 'FAILED', 0, str(e))
+        finally:
+            orchestrator.close_connections()
+            
+        # Read the run back through a fresh connection
+        conn = sqlite3.connect(os.path.join(data_path, 'metadata.db'))
+        try:
+            rows = conn.execute("""
+                SELECT status, end_time, error_message FROM pipeline_runs WHERE run_id = ?
+            """, (run_id,)).fetchall()
+        finally:
+            conn.close()
+            
+        assert len(rows) == 1, f"expected one pipeline_runs row for {run_id}, found {len(rows)}"
+        status, end_time, error_message = rows[0]
+        assert status == 'FAILED', f"run was written with status {status}"
+        assert end_time is not None, "failed run has no end_time"
+        assert error_message == "simulated load failure", f"unexpected error_message: {error_message}"
+        print(f"   ✅ Run {run_id} written with status FAILED")
+        
+        return True
+        
+    except Exception as e:
+        print(f"   ❌ Failed run logging test failed: {str(e)}")
+        return False
+        
+    finally:
+        shutil.rmtree(test_dir, ignore_errors=True)
+
+
+def run_raw_id_parsing_test():
+    """Check that float-formatted and non-numeric IDs load on both CSV reader paths"""
+    print("🔢 Testing raw ID parsing...")
+    
+    import pipeline.layer1_staging as staging_module
+    from pipeline.layer1_staging import StagingLayer
+    
+    # (index, date, customer_id, order_id, sales) -> expected (customer_id, order_id, flag)
+    fixture = [
+        (('0', '2021-01-01', '990787.0', '1', '167.72'), (990787, 1, 'VALID')),
+        (('1', '2021-01-01', '284871', '2.0', '164.37'), (284871, 2, 'VALID')),
+        (('2', '2021-01-02', 'abc', '3', '10.00'), (None, 3, 'INVALID_CUSTOMER')),
+        (('3', '2021-01-02', '284871', 'x12', '10.00'), (284871, None, 'INVALID_ORDER')),
+        (('4', '2021-01-03', '284871', '5', '12.50'), (284871, 5, 'VALID')),
+    ]
+    expected = [result for _, result in fixture]
+    
+    test_dir = tempfile.mkdtemp(prefix='raw_id_test_')
+    pa_csv = staging_module.pa_csv
+    orchestrator = None
+    
+    try:
+        test_csv = os.path.join(test_dir, 'sales.csv')
+        with open(test_csv, 'w') as f:
+            f.write(',Date,Customer ID,Order ID,Sales\n')
+            for row, _ in fixture:
+                f.write(','.join(row) + '\n')
+                
+        # PyArrow reader (when installed), then the csv module fallback
+        readers = [('pyarrow', pa_csv)] if pa_csv is not None else []
+        readers.append(('csv module', None))
+        for position, (reader_name, reader) in enumerate(readers):
+            staging_module.pa_csv = reader
+            orchestrator = DataPipelineOrchestrator(os.path.join(test_dir, f'data_{position}'))
+            
+            staging = StagingLayer(orchestrator)
+            staging.create_staging_schema()
+            staging.ingest_raw_data(test_csv)
+            staging.clean_and_validate_data()
+            
+            raw_types = staging.staging_conn.execute("""
+                SELECT DISTINCT typeof(customer_id), typeof(order_id)
+                FROM stg_sales_raw
+                WHERE customer_id IS NOT NULL AND order_id IS NOT NULL
+            """).fetchall()
+            actual = staging.staging_conn.execute("""
+                SELECT customer_id, order_id, data_quality_flag
+                FROM stg_sales_cleaned
+                ORDER BY rowid
+            """).fetchall()
+            
+            assert raw_types == [('integer', 'integer')], f"{reader_name}: IDs stored as {raw_types}"
+            assert actual == expected, f"{reader_name}: {actual} != {expected}"
+            print(f"   ✅ {reader_name}: float IDs loaded as integers, non-numeric IDs flagged")
+            
+            orchestrator.close_connections()
+            orchestrator = None
+            
+        return True
+        
+    except Exception as e:
+        print(f"   ❌ Raw ID parsing test failed: {str(e)}")
+        return False
+        
+    finally:
+        staging_module.pa_csv = pa_csv
+        if orchestrator:
+            orchestrator.close_connections()
+        shutil.rmtree(test_dir, ignore_errors=True)
+
+
 if __name__ == "__main__":
     import argparse
     
     parser = argparse.ArgumentParser(description='Test the enhanced marketing analytics pipeline')
     parser.add_argument('--enhanced', action='store_true', help='Run comprehensive enhanced pipeline test')
     parser.add_argument('--retention', action='store_true', help='Run focused retention analysis test')
+    parser.add_argument('--cache', action='store_true', help='Run staging cache hit/miss test')
+    parser.add_argument('--quartiles', action='store_true', help='Run order amount quartile test')
+    parser.add_argument('--failed-run', action='store_true', help='Run failed run logging test')
+    parser.add_argument('--raw-ids', action='store_true', help='Run raw ID parsing test')
     parser.add_argument('--csv-file', type=str, help='Path to CSV file (default: ./data/raw/HEC_testing_data_sample_2_.csv)')
     
     args = parser.parse_args()
@@ -776,6 +1042,14 @@ if __name__ == "__main__":
         success = run_enhanced_pipeline_test()
     elif args.retention:
         success = run_retention_analysis_test()
+    elif args.cache:
+        success = run_staging_cache_test(args.csv_file)
+    elif args.quartiles:
+        success = run_order_quartile_test()
+    elif args.failed_run:
+        success = run_failed_run_logging_test()
+    elif args.raw_ids:
+        success = run_raw_id_parsing_test()
     else:
         # Default: run enhanced test
         csv_path = args.csv_file or './data/raw/HEC_testing_data_sample_2_.csv'